@@ -0,0 +1,233 @@
+import gc
+import itertools
+import json
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import click
+import numpy as np
+
+from nl2ltl_dataset_generator.base.core import TermBuilder, TermBuildingMode, Sampler, PairsGenerator, iter_strings
+from nl2ltl_dataset_generator.base.data_model import Dataset, DatasetType, Pair
+from nl2ltl_dataset_generator.base.loader import load_unrestricted_identifiers, save_csv
+from nl2ltl_dataset_generator.base.patterns import build_pair_types, default_pattern_declarations
+
+RESOURCES_PATH = Path(__file__).resolve().parent.parent / "resources"
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+DEFAULT_SIZES = (10000, 100000, 1000000)
+SEED = 42
+# wall time allowed to `python -m nl2ltl_dataset_generator.main --help`, most of it is the start of the interpreter
+STARTUP_TARGET_SECONDS = .3
+# pairs rendered and written are taken from a pool of at most this size, the cost does not depend on their variety
+MAX_POOL_SIZE = 100000
+
+
+def get_pair_type(name: str = "response_global"):
+    return next(pair_type for pair_type in build_pair_types(default_pattern_declarations) if str(pair_type) == name)
+
+
+def get_pool(n_samples: int) -> List[Pair]:
+    identifiers = load_unrestricted_identifiers(RESOURCES_PATH / "ids3.txt")
+    sampler = Sampler(identifiers, get_pair_type())
+    pairs = list(sampler.get_pairs(min(n_samples, MAX_POOL_SIZE), random.Random(SEED)))
+    return list(iter_strings(pairs, random.Random(SEED)))
+
+
+def cycle(pairs: List[Pair], n_samples: int) -> List[Pair]:
+    return list(itertools.islice(itertools.cycle(pairs), n_samples))
+
+
+def bench_term_builder_get_terms(n_samples: int) -> Callable[[], None]:
+    identifiers = load_unrestricted_identifiers(RESOURCES_PATH / "ids3.txt")
+    term_builder = TermBuilder(3, TermBuildingMode.LEQ)
+    # the terms are enumerated again when there are fewer than n_samples
+    return lambda: list(itertools.islice(
+        itertools.chain.from_iterable(term_builder.get_terms(identifiers) for _ in itertools.count()), n_samples
+    ))
+
+
+def bench_sampler_get_pairs(n_samples: int) -> Callable[[], None]:
+    sampler = Sampler(load_unrestricted_identifiers(RESOURCES_PATH / "ids3.txt"), get_pair_type())
+    return lambda: list(sampler.get_pairs(n_samples, random.Random(SEED)))
+
+
+def bench_pairs_generator_get_pairs(n_samples: int) -> Callable[[], None]:
+    pair_type = get_pair_type()
+    return lambda: list(PairsGenerator.get_pairs(pair_type, n_samples, random.Random(SEED)))
+
+
+def bench_restricted_batch_get_pairs(n_samples: int) -> Callable[[], None]:
+    from nl2ltl_dataset_generator.base.batch import RestrictedPairsBatchGenerator
+
+    # the batched counterpart of pairs_generator_get_pairs
+    pair_type = get_pair_type()
+    return lambda: list(RestrictedPairsBatchGenerator(np.random.default_rng(SEED)).get_pairs(pair_type, n_samples))
+
+
+def bench_phrase_rendering(n_samples: int) -> Callable[[], None]:
+    pairs = cycle(get_pool(n_samples), n_samples)
+
+    def run():
+        rng = random.Random(SEED)
+        for pair in pairs:
+            pair.update_phrase(rng)
+
+    return run
+
+
+def bench_formula_rendering(n_samples: int) -> Callable[[], None]:
+    pairs = cycle(get_pool(n_samples), n_samples)
+
+    def run():
+        for pair in pairs:
+            pair.update_formula()
+
+    return run
+
+
+def bench_batch_rendering(n_samples: int) -> Callable[[], None]:
+    from nl2ltl_dataset_generator.base.batch import BatchRenderer
+
+    # renders phrases and formulas, compare it with the sum of phrase_rendering and formula_rendering
+    pairs = cycle(get_pool(n_samples), n_samples)
+    return lambda: BatchRenderer(np.random.default_rng(SEED)).render(pairs)
+
+
+def bench_restricted_rendering(n_samples: int) -> Callable[[], None]:
+    from nl2ltl_dataset_generator.base.batch import RestrictedPairsBatchGenerator
+
+    # the shards of restricted datasets: batched pairs rendered one by one, their terms are built by the rendering
+    pair_type = get_pair_type()
+    return lambda: list(iter_strings(
+        RestrictedPairsBatchGenerator(np.random.default_rng(SEED)).get_pairs(pair_type, n_samples), random.Random(SEED)
+    ))
+
+
+def bench_restricted_batch_rendering(n_samples: int) -> Callable[[], None]:
+    from nl2ltl_dataset_generator.base.batch import BatchRenderer, RestrictedPairsBatchGenerator
+
+    # the same with --batch-rendering, whose BatchRenderer renders each batch from its lists without building the terms
+    pair_type = get_pair_type()
+    return lambda: BatchRenderer(np.random.default_rng(SEED)).render(
+        RestrictedPairsBatchGenerator(np.random.default_rng(SEED)).get_pairs(pair_type, n_samples)
+    )
+
+
+def bench_save_csv(n_samples: int) -> Callable[[], None]:
+    dataset = Dataset(cycle(get_pool(n_samples), n_samples), DatasetType.UNRESTRICTED)
+    file_path = Path(tempfile.mkdtemp()) / "dataset.csv"
+    return lambda: save_csv(dataset, file_path)
+
+
+benchmarks: Dict[str, Callable[[int], Callable[[], None]]] = {
+    "term_builder_get_terms": bench_term_builder_get_terms,
+    "sampler_get_pairs": bench_sampler_get_pairs,
+    "pairs_generator_get_pairs": bench_pairs_generator_get_pairs,
+    "restricted_batch_get_pairs": bench_restricted_batch_get_pairs,
+    "phrase_rendering": bench_phrase_rendering,
+    "formula_rendering": bench_formula_rendering,
+    "batch_rendering": bench_batch_rendering,
+    "restricted_rendering": bench_restricted_rendering,
+    "restricted_batch_rendering": bench_restricted_batch_rendering,
+    "save_csv": bench_save_csv,
+}
+
+
+def measure(benchmark: Callable[[int], Callable[[], None]], n_samples: int, repeats: int) -> float:
+    """Best wall time of repeats runs, the setup of the benchmark is not timed."""
+    run = benchmark(n_samples)
+    times = []
+
+    for _ in range(repeats):
+        gc.collect()
+        start_time = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start_time)
+
+    return min(times)
+
+
+def measure_startup(repeats: int) -> float:
+    """Best wall time of the CLI help, which imports the package and parses the options."""
+    times = []
+
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable, "-m", "nl2ltl_dataset_generator.main", "--help"], check=True,
+                       stdout=subprocess.DEVNULL, cwd=RESOURCES_PATH.parent)
+        times.append(time.perf_counter() - start_time)
+
+    return min(times)
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+
+    for name, sizes in results.items():
+        for size, seconds in sizes.items():
+            baseline_seconds = baseline.get(name, {}).get(size)
+            if baseline_seconds is not None and seconds > baseline_seconds * (1 + tolerance):
+                regressions.append(f"{name} [{size}]: {seconds:.4f} s, baseline {baseline_seconds:.4f} s "
+                                   f"(+{seconds / baseline_seconds - 1:.0%})")
+
+    return regressions
+
+
+@click.command()
+@click.option("--benchmark", "-b", "names", multiple=True, type=click.Choice(list(benchmarks)),
+              help="Benchmarks to run, all if not provided.")
+@click.option("--size", "-s", "sizes", multiple=True, type=click.IntRange(min=1), default=DEFAULT_SIZES)
+@click.option("--repeats", "-n", type=click.IntRange(min=1), default=3)
+@click.option("--baseline-path", type=click.Path(dir_okay=False), default=BASELINE_PATH)
+@click.option("--save-baseline", is_flag=True, default=False, help="Save the results as the new baseline.")
+@click.option("--startup/--no-startup", default=True, help="Also time the start of the CLI.")
+@click.option("--tolerance", type=click.FloatRange(min=0), default=.2,
+              help="Relative slowdown over the baseline reported as a regression.")
+def main(names, sizes, repeats, baseline_path, save_baseline, startup, tolerance):
+    baseline_path = Path(baseline_path)
+    results = {}
+    regressions = []
+
+    if startup:
+        seconds = measure_startup(repeats)
+        results["cli_startup"] = {"help": seconds}
+        print(f"{'cli_startup':<28}{'help':>9}{seconds:>11.4f} s")
+        if seconds > STARTUP_TARGET_SECONDS:
+            regressions.append(f"cli_startup [help]: {seconds:.4f} s, target {STARTUP_TARGET_SECONDS:.4f} s")
+
+    for name in names or benchmarks:
+        results[name] = {}
+        for size in sizes:
+            seconds = measure(benchmarks[name], size, repeats)
+            results[name][str(size)] = seconds
+            print(f"{name:<28}{size:>9}{seconds:>11.4f} s{seconds / size * 1e9:>10.0f} ns/sample{size / seconds:>10.0f} samples/s")
+
+    if save_baseline:
+        baseline_path.write_text(json.dumps({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "results": results,
+        }, indent=2) + "\n")
+        print(f"Baseline saved in {baseline_path.resolve()}")
+        return
+
+    if not baseline_path.exists():
+        print(f"No baseline in {baseline_path.resolve()}, run with --save-baseline to create it.")
+        return
+
+    regressions.extend(compare(results, json.loads(baseline_path.read_text())["results"], tolerance))
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+
+    if regressions:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,53 @@
-from nl2ltl_dataset_generator.base.log import log_time, get_means
+from nl2ltl_dataset_generator.base.log import log_time, get_means, registry, MetricsRegistry, PIPELINE_SCOPE, SAMPLING_SCOPE, \
+    RENDERING_SCOPE
+from nl2ltl_dataset_generator.base.profiling import profiler, Profiler, StageProfile, SETUP_STAGE, IDENTIFIERS_STAGE, \
+    SAMPLING_STAGE, RENDERING_STAGE, POSTPROCESSING_STAGE, EXPORT_STAGE, WORKERS_STAGE
 from nl2ltl_dataset_generator.base.core import generation_strategy_factory, DatasetGenerator, PairType
-from nl2ltl_dataset_generator.base.data_model import Pattern, Scope, PairTypeDistribution, DatasetDistribution, DatasetType
-from nl2ltl_dataset_generator.base.loader import save_csv
-from nl2ltl_dataset_generator.base.exceptions import InvalidDatasetType
+from nl2ltl_dataset_generator.base.data_model import Pattern, Scope, PairTypeDistribution, DatasetDistribution, DatasetType, Shard, \
+    derive_seed
+from nl2ltl_dataset_generator.base.parallel import ShardedDatasetGenerator, DEFAULT_SHARD_SIZE
+from nl2ltl_dataset_generator.base.checkpoint import CheckpointedDatasetGenerator, read_manifest
+from nl2ltl_dataset_generator.base.dedup import DeduplicatedDatasetGenerator, DeduplicationStats, DEFAULT_MEMORY_LIMIT, \
+    hash_row, dedup_keys, PairIndex
+from nl2ltl_dataset_generator.base.ltl import parse_formula, canonicalize, hash_formula, ValidatedDatasetGenerator, Formula
+from nl2ltl_dataset_generator.base.sample_stream import SampleStream, Sample
+from nl2ltl_dataset_generator.base.planner import plan_dataset, DatasetPlan, PairTypePlan
+from nl2ltl_dataset_generator.base.loader import save_csv, save_csv_stream, save_opennmt_format, assign_split, DatasetSplitter, SPLITS, \
+    load_unrestricted_identifiers, iter_identifier_entries, reservoir_sample
+from nl2ltl_dataset_generator.base.patterns import PatternDeclaration, default_pattern_declarations, register_pattern, \
+    load_pattern_declarations, build_pair_types
+from nl2ltl_dataset_generator.base.writers import DatasetWriter, RowsWriter, RowsFile, rows_writers, OUTPUT_FORMATS, COMPRESSIONS
+from nl2ltl_dataset_generator.base.exceptions import InvalidDatasetType, NotEnoughUniquePairs, InvalidPatternDeclaration, \
+    InvalidCheckpoint, InvalidIdentifiersLine, InvalidGenerationRequest, \
+    InvalidFormula, InvalidPairIndex
 from nl2ltl_dataset_generator.base.formula_templates import absence_global_formula_template, \
     universal_global_formula_template, existence_global_formula_template, response_global_formula_template, \
     absence_after_formula_template, universal_after_formula_template, existence_after_formula_template, \
-    response_after_formula_template
+    response_after_formula_template, get_formula_template, register_formula_template
 from nl2ltl_dataset_generator.base.phrase_templates import absence_global_phrase_template, universal_global_phrase_template, \
     existence_global_phrase_template, response_global_phrase_template, absence_after_phrase_template, \
-    universal_after_phrase_template, existence_after_phrase_template, response_after_phrase_template
\ No newline at end of file
+    universal_after_phrase_template, existence_after_phrase_template, response_after_phrase_template, \
+    get_phrase_template, register_phrase_templates
+
+# modules that import NumPy (or other heavy packages) as soon as they are loaded, imported on first access
+_lazy_attributes = {
+    "ColumnarDataset": "nl2ltl_dataset_generator.base.columnar",
+    "generate_columnar_dataset": "nl2ltl_dataset_generator.base.columnar",
+    "PAIR_DTYPE": "nl2ltl_dataset_generator.base.columnar",
+    "RestrictedPairsBatchGenerator": "nl2ltl_dataset_generator.base.batch",
+    "RestrictedPairsBatch": "nl2ltl_dataset_generator.base.batch",
+    "BatchPair": "nl2ltl_dataset_generator.base.batch",
+    "BatchRenderer": "nl2ltl_dataset_generator.base.batch",
+    "rendering_stats": "nl2ltl_dataset_generator.base.batch",
+    "TokenizedDatasetWriter": "nl2ltl_dataset_generator.base.tokenized",
+    "Vocabulary": "nl2ltl_dataset_generator.base.tokenized",
+    "load_tokenized_dataset": "nl2ltl_dataset_generator.base.tokenized",
+}
+
+
+def __getattr__(name: str):
+    if name not in _lazy_attributes:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    import importlib
+    return getattr(importlib.import_module(_lazy_attributes[name]), name)
@@ -0,0 +1,282 @@
+import itertools
+import random
+import time
+from dataclasses import dataclass
+from typing import List, Generator, Any, Iterable
+
+import numpy as np
+
+from nl2ltl_dataset_generator.base.core import RestrictedIdentifierGenerator, TermGenerator, get_terms_dimension
+from nl2ltl_dataset_generator.base.data_model import Pair, PairTerm, PairType, RestrictedIdentifier, RESTRICTED_DETERMINERS, \
+    LogicalOperator
+from nl2ltl_dataset_generator.base.log import log_time, SAMPLING_SCOPE, RENDERING_SCOPE
+from nl2ltl_dataset_generator.base.phrase_templates import compiled_logical_operator_phrase_templates
+
+
+class RestrictedPairsBatch:
+    """The pairs of a batch of RestrictedPairsBatchGenerator, kept as the flat lists they were drawn as.
+
+    The terms of a pair, with their identifiers, are built only when they are read: the BatchRenderer renders a whole
+    batch from the lists, and the other renderers build the terms of each pair as they render it.
+    """
+    LOGICAL_OPERATOR_CHOICES = [LogicalOperator.AND, LogicalOperator.OR, None]
+
+    def __init__(self, pair_type: PairType, identifiers: List[str], dimensions: List[int], symbols: List[int]):
+        self.pair_type = pair_type
+        # the strings of the identifiers of the terms, one term after the other
+        self.identifiers = identifiers
+        # number of identifiers and index in LOGICAL_OPERATOR_CHOICES of each term, n_terms terms per pair
+        self.dimensions = dimensions
+        self.symbols = symbols
+        self.starts = list(itertools.accumulate(dimensions, initial=0))
+        self.pairs = list(map(BatchPair, itertools.repeat(self), range(len(dimensions) // pair_type.n_terms)))
+
+    def __len__(self) -> int:
+        return len(self.pairs)
+
+    def get_terms(self, index: int) -> List[PairTerm]:
+        n_terms = self.pair_type.n_terms
+        return [
+            PairTerm(
+                [RestrictedIdentifier(RESTRICTED_DETERMINERS, identifier)
+                 for identifier in self.identifiers[self.starts[term_index]:self.starts[term_index + 1]]],
+                self.LOGICAL_OPERATOR_CHOICES[self.symbols[term_index]]
+            )
+            for term_index in range(index * n_terms, (index + 1) * n_terms)
+        ]
+
+    def get_term_formulas(self) -> List[str]:
+        """The formula string of every term, as PairTerm.get_formula_string."""
+        separators = [f" {logical_operator.value} " for logical_operator in self.LOGICAL_OPERATOR_CHOICES[:-1]]
+        identifiers = self.identifiers
+        return [
+            identifiers[start] if dimension == 1 else separators[symbol].join(identifiers[start:start + dimension])
+            for start, dimension, symbol in zip(self.starts, self.dimensions, self.symbols)
+        ]
+
+
+class BatchPair(Pair):
+    """A Pair of a RestrictedPairsBatch, whose terms are built by the batch when they are first read."""
+    def __init__(self, batch: RestrictedPairsBatch, index: int):
+        self.batch = batch
+        self.index = index
+        # the terms are None until they are read, see the terms property
+        super(BatchPair, self).__init__(None, batch.pair_type)
+
+    @property
+    def terms(self) -> List[PairTerm]:
+        if (terms := self.__dict__["_terms"]) is None:
+            terms = self.__dict__["_terms"] = self.batch.get_terms(self.index)
+        return terms
+
+    @terms.setter
+    def terms(self, terms: List[PairTerm]) -> None:
+        self.__dict__["_terms"] = terms
+
+
+class RestrictedPairsBatchGenerator:
+    """Generates Restricted Pair in batches, drawing every random number of a batch with a few NumPy calls.
+
+    Lengths, characters, term dimensions and logical operators follow the same distributions of PairsGenerator. The
+    pairs are BatchPair of a RestrictedPairsBatch, so no object is built for their terms and identifiers until they
+    are read.
+    """
+    BATCH_SIZE = 4096
+
+    def __init__(self, rng: np.random.Generator):
+        identifier_generator = RestrictedIdentifierGenerator()
+        self.min_length = identifier_generator.min_length
+        self.max_length = identifier_generator.max_length
+        self.letters = np.frombuffer(identifier_generator.letters.encode(), dtype=np.uint8)
+        self.logical_operators = TermGenerator().LOGICAL_OPERATORS_CHOICES
+        self.rng = rng
+
+    def _get_identifiers(self, n_identifiers: int) -> List[str]:
+        lengths = self.rng.integers(self.min_length, self.max_length + 1, n_identifiers)
+
+        # identifiers are written one after the other, separated by a space, and split in a single call
+        ends = np.cumsum(lengths + 1)
+        characters = np.full(ends[-1] - 1, ord(' '), dtype=np.uint8)
+        is_letter = np.ones(len(characters), dtype=bool)
+        is_letter[ends[:-1] - 1] = False
+        characters[is_letter] = self.letters[self.rng.integers(0, len(self.letters), int(lengths.sum()))]
+
+        return characters.tobytes().decode().split(' ')
+
+    def _get_batch(self, pair_type: PairType, n_samples: int) -> List[Pair]:
+        terms_dimension, _ = get_terms_dimension(pair_type.n_terms)
+        n_terms = n_samples * pair_type.n_terms
+
+        dimensions = self.rng.integers(1, terms_dimension + 1, n_terms)
+        symbols = self.rng.integers(0, len(self.logical_operators), n_terms)
+        # terms made of a single identifier have no logical operator, the last entry of the choices
+        symbols[dimensions == 1] = len(self.logical_operators)
+
+        identifiers = self._get_identifiers(int(dimensions.sum()))
+        return RestrictedPairsBatch(pair_type, identifiers, dimensions.tolist(), symbols.tolist()).pairs
+
+    @log_time(scope=SAMPLING_SCOPE)
+    def get_pairs(self, pair_type: PairType, n_samples: int = None) -> Generator[Pair, Any, None]:
+        n_samples = n_samples if n_samples is not None else pair_type.distribution.new_value
+
+        for start in range(0, n_samples, self.BATCH_SIZE):
+            yield from self._get_batch(pair_type, min(self.BATCH_SIZE, n_samples - start))
+
+
+def get_restricted_pairs_batch_generator(rng: random.Random) -> RestrictedPairsBatchGenerator:
+    """A RestrictedPairsBatchGenerator drawing from a NumPy generator seeded by rng."""
+    return RestrictedPairsBatchGenerator(np.random.default_rng(rng.getrandbits(128)))
+
+
+@dataclass
+class RenderingStats:
+    n_pairs: int = 0
+    seconds: float = 0.
+
+    @property
+    def pairs_per_second(self) -> float:
+        return self.n_pairs / self.seconds if self.seconds else 0.
+
+
+# pairs rendered by the BatchRenderer instances of this process
+rendering_stats = RenderingStats()
+
+# most identifier slots in a variant of the logical operators phrase templates
+MAX_VARIANT_SLOTS = max(
+    sum(part.__class__ is not str for part in variant)
+    for variants in compiled_logical_operator_phrase_templates.values() for variant in variants
+)
+
+
+class BatchRenderer:
+    """Renders the phrases and the formulas of the pairs PairType by PairType, in batches.
+
+    The random numbers choosing the phrase templates, the logical operator variants and the determiners of a batch are
+    drawn with a single NumPy call, then the strings are assembled in a loop. Every choice is uniform, as in
+    Pair.update_phrase, although the random stream is a different one.
+    """
+    BATCH_SIZE = 4096
+
+    def __init__(self, rng: np.random.Generator):
+        self.rng = rng
+
+    @staticmethod
+    def _get_max_draws(pair_type: PairType) -> int:
+        n_slots = max(sum(part.__class__ is not str for part in alternative) for alternative in pair_type.phrase_templates.alternatives)
+        return 1 + n_slots * (1 + MAX_VARIANT_SLOTS)
+
+    @staticmethod
+    def _is_whole_batch(pairs: List[Pair]) -> bool:
+        """Whether the pairs are the ones of a RestrictedPairsBatch, in order."""
+        first, last = pairs[0], pairs[-1]
+        return (first.__class__ is BatchPair and last.__class__ is BatchPair and first.batch is last.batch
+                and first.index == 0 and len(pairs) == len(first.batch))
+
+    @staticmethod
+    def _render_restricted_batch(batch: RestrictedPairsBatch, draws: List[List[float]]) -> None:
+        """Render the pairs of the batch from its lists, with the same draws that _render_batch would use."""
+        pair_type = batch.pair_type
+        alternatives = pair_type.phrase_templates.alternatives
+        formula_parts = pair_type.formula_template.parts
+        n_terms = pair_type.n_terms
+        identifiers, starts, dimensions, symbols = batch.identifiers, batch.starts, batch.dimensions, batch.symbols
+        term_formulas = batch.get_term_formulas()
+        variants_by_term = [
+            compiled_logical_operator_phrase_templates[RestrictedPairsBatch.LOGICAL_OPERATOR_CHOICES[symbol], dimension]
+            if dimension > 1 else None
+            for dimension, symbol in zip(dimensions, symbols)
+        ]
+
+        for pair, pair_draws in zip(batch.pairs, draws):
+            draw = iter(pair_draws).__next__
+            first_term = pair.index * n_terms
+            parts = []
+
+            for part in alternatives[int(draw() * len(alternatives))]:
+                if part.__class__ is str:
+                    parts.append(part)
+                    continue
+
+                term_index = first_term + part
+                start = starts[term_index]
+                variants = variants_by_term[term_index]
+
+                # restricted identifiers have a single phrase string, but the draw choosing it is still consumed
+                if variants is None:
+                    draw()
+                    parts.append(identifiers[start])
+                    continue
+
+                for variant_part in variants[int(draw() * len(variants))]:
+                    if variant_part.__class__ is str:
+                        parts.append(variant_part)
+                    else:
+                        draw()
+                        parts.append(identifiers[start + variant_part])
+
+            pair.phrase = ''.join(parts)
+            pair.formula = ''.join([
+                part if part.__class__ is str else term_formulas[first_term + part] for part in formula_parts
+            ])
+
+    def _render_batch(self, pair_type: PairType, pairs: List[Pair]) -> None:
+        alternatives = pair_type.phrase_templates.alternatives
+        formula_template = pair_type.formula_template
+        draws = self.rng.random((len(pairs), self._get_max_draws(pair_type))).tolist()
+
+        if self._is_whole_batch(pairs):
+            self._render_restricted_batch(pairs[0].batch, draws)
+            return
+
+        for pair, pair_draws in zip(pairs, draws):
+            draw = iter(pair_draws).__next__
+            terms = pair.terms
+            parts = []
+
+            for part in alternatives[int(draw() * len(alternatives))]:
+                if part.__class__ is str:
+                    parts.append(part)
+                    continue
+
+                term = terms[part]
+                identifiers = term.identifiers
+
+                if term.logical_operator is None:
+                    phrase_strings = identifiers[0].phrase_strings
+                    parts.append(phrase_strings[int(draw() * len(phrase_strings))])
+                    continue
+
+                variants = compiled_logical_operator_phrase_templates[term.logical_operator, len(identifiers)]
+                for variant_part in variants[int(draw() * len(variants))]:
+                    if variant_part.__class__ is str:
+                        parts.append(variant_part)
+                    else:
+                        phrase_strings = identifiers[variant_part].phrase_strings
+                        parts.append(phrase_strings[int(draw() * len(phrase_strings))])
+
+            pair.phrase = ''.join(parts)
+            pair.formula = formula_template.get_string(terms)
+
+    @log_time(scope=RENDERING_SCOPE)
+    def render(self, pairs: Iterable[Pair]) -> List[Pair]:
+        """Render the pairs in place, returns them in the same order."""
+        start_time = time.perf_counter()
+        pairs = list(pairs)
+
+        pairs_by_type = {}
+        for pair in pairs:
+            pairs_by_type.setdefault(id(pair.pair_type), []).append(pair)
+
+        for pair_type_pairs in pairs_by_type.values():
+            for start in range(0, len(pair_type_pairs), self.BATCH_SIZE):
+                self._render_batch(pair_type_pairs[0].pair_type, pair_type_pairs[start:start + self.BATCH_SIZE])
+
+        rendering_stats.n_pairs += len(pairs)
+        rendering_stats.seconds += time.perf_counter() - start_time
+
+        return pairs
+
+
+def get_batch_renderer(rng: random.Random) -> BatchRenderer:
+    """A BatchRenderer drawing from a NumPy generator seeded by rng."""
+    return BatchRenderer(np.random.default_rng(rng.getrandbits(128)))
@@ -0,0 +1,175 @@
+import csv
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import List, Generator, Any, Dict
+
+from nl2ltl_dataset_generator.base.data_model import Pair, Shard, Dataset
+from nl2ltl_dataset_generator.base.exceptions import InvalidCheckpoint
+from nl2ltl_dataset_generator.base.loader import pair_to_row
+from nl2ltl_dataset_generator.base.log import log_time
+from nl2ltl_dataset_generator.base.parallel import ShardedDatasetGenerator
+
+MANIFEST_VERSION = 1
+
+
+def _write_atomically(file_path: Path, write) -> None:
+    """Write through a temporary file renamed at the end, so that file_path is either complete or missing."""
+    temporary_path = file_path.with_name(f"{file_path.name}.tmp")
+
+    with temporary_path.open('w', newline='') as fp:
+        write(fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    os.replace(temporary_path, file_path)
+
+
+def read_manifest(checkpoint_path: Path) -> dict:
+    """The manifest of the run saved in checkpoint_path, None if there is none."""
+    manifest_path = checkpoint_path / CheckpointedDatasetGenerator.MANIFEST_NAME
+    return json.loads(manifest_path.read_text()) if manifest_path.exists() else None
+
+
+class CheckpointedDatasetGenerator:
+    """Saves each chunk of a ShardedDatasetGenerator to its own file as soon as it is generated.
+
+    manifest.json, in checkpoint_path, records the configuration of the run (seed, shard size, pair types and
+    identifiers), the completed chunks with their shard and seed, the per-PairType progress and, once finished, the
+    output files. When resuming, completed chunks are read back instead of generated again: since every shard has its
+    own random stream, the output is the same of a run that was never interrupted.
+    """
+    MANIFEST_NAME = "manifest.json"
+
+    def __init__(self, sharded_dataset_generator: ShardedDatasetGenerator, checkpoint_path: Path, resume: bool = False):
+        self.sharded_dataset_generator = sharded_dataset_generator
+        self.dataset_distribution = sharded_dataset_generator.dataset_distribution
+        self.dataset_type = sharded_dataset_generator.dataset_type
+        self.generation_strategy = sharded_dataset_generator.generation_strategy
+        self.seed = sharded_dataset_generator.seed
+        self.checkpoint_path = checkpoint_path
+        self.resume = resume
+        self.manifest: dict = None
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.checkpoint_path / self.MANIFEST_NAME
+
+    def get_shards(self) -> List[Shard]:
+        return self.sharded_dataset_generator.get_shards()
+
+    def _get_config(self) -> dict:
+        identifiers = self.generation_strategy.identifiers or []
+        return {
+            "dataset_type": str(self.dataset_type.name).lower(),
+            "seed": self.seed,
+            "shard_size": self.sharded_dataset_generator.shard_size,
+            "n_samples": self.dataset_distribution.n_samples,
+            "pair_types": {str(pair_type): pair_type.distribution.new_value for pair_type in self.dataset_distribution.pair_types},
+            "batch_rendering": self.generation_strategy.batch_rendering,
+            "identifiers": hashlib.sha256("\n".join(map(repr, identifiers)).encode()).hexdigest(),
+            # the compiled templates, so that chunks rendered with edited templates are not mixed with new ones
+            "templates": hashlib.sha256("\n".join(
+                repr((str(pair_type), pair_type.formula_template.parts, pair_type.phrase_templates.alternatives))
+                for pair_type in self.dataset_distribution.pair_types
+            ).encode()).hexdigest(),
+        }
+
+    def _save_manifest(self) -> None:
+        _write_atomically(self.manifest_path, lambda fp: json.dump(self.manifest, fp, indent=2))
+
+    def _open(self) -> Dict[int, dict]:
+        """Load the manifest to resume from, or start a new one, returns the completed chunks by index."""
+        config = self._get_config()
+
+        if self.resume and (manifest := read_manifest(self.checkpoint_path)) is not None:
+            self.manifest = manifest
+            if self.manifest.get("version") != MANIFEST_VERSION:
+                raise InvalidCheckpoint(self.checkpoint_path, f"unsupported manifest version {self.manifest.get('version')}")
+            if self.manifest["config"] != config:
+                changed = [key for key, value in config.items() if self.manifest["config"].get(key) != value]
+                raise InvalidCheckpoint(self.checkpoint_path, f"the run differs in {', '.join(changed)}")
+        else:
+            self.checkpoint_path.mkdir(parents=True, exist_ok=True)
+            for chunk_path in self.checkpoint_path.glob("chunk-*.csv"):
+                chunk_path.unlink()
+            self.manifest = {
+                "version": MANIFEST_VERSION,
+                "config": config,
+                "chunks": [],
+                "progress": {str(pair_type): 0 for pair_type in self.dataset_distribution.pair_types},
+                "output_files": [],
+            }
+            self._save_manifest()
+
+        return {entry["index"]: entry for entry in self.manifest["chunks"]}
+
+    def _write_chunk(self, index: int, shard: Shard, pairs: List[Pair]) -> None:
+        file_name = f"chunk-{index:06d}.csv"
+        _write_atomically(
+            self.checkpoint_path / file_name,
+            lambda fp: csv.writer(fp, lineterminator='\n').writerows(pair_to_row(pair) for pair in pairs)
+        )
+
+        pair_type_name = str(self.dataset_distribution.pair_types[shard.pair_type_index])
+        self.manifest["chunks"].append({
+            "index": index,
+            "pair_type": pair_type_name,
+            "shard_index": shard.shard_index,
+            "start": shard.start,
+            "stop": shard.stop,
+            "seed": str(shard.seed),
+            "file": file_name,
+            "rows": len(pairs),
+        })
+        self.manifest["progress"][pair_type_name] += len(pairs)
+        self._save_manifest()
+
+    def _read_chunk(self, entry: dict, shard: Shard) -> List[Pair]:
+        if entry["seed"] != str(shard.seed):
+            raise InvalidCheckpoint(self.checkpoint_path, f"the seed of {entry['file']} does not match its shard")
+
+        chunk_path = self.checkpoint_path / entry["file"]
+        if not chunk_path.exists():
+            raise InvalidCheckpoint(self.checkpoint_path, f"{entry['file']} is missing")
+
+        pair_type = self.dataset_distribution.pair_types[shard.pair_type_index]
+        with chunk_path.open('r', newline='') as fp:
+            try:
+                pairs = [Pair([], pair_type, phrase, formula) for _, formula, phrase in csv.reader(fp)]
+            except ValueError:
+                raise InvalidCheckpoint(self.checkpoint_path, f"{entry['file']} has a truncated row") from None
+
+        if len(pairs) != entry["rows"]:
+            raise InvalidCheckpoint(self.checkpoint_path, f"{entry['file']} has {len(pairs)} rows, not {entry['rows']}")
+
+        return pairs
+
+    def generate_chunks(self) -> Generator[List[Pair], Any, None]:
+        completed_chunks = self._open()
+        shards = self.get_shards()
+
+        pending_shards = [shard for index, shard in enumerate(shards) if index not in completed_chunks]
+        if completed_chunks:
+            print(f"Resuming from {self.checkpoint_path.resolve()}: {len(completed_chunks)} of {len(shards)} chunks completed")
+
+        generated_chunks = self.sharded_dataset_generator.generate_chunks(pending_shards)
+
+        for index, shard in enumerate(shards):
+            if index in completed_chunks:
+                yield self._read_chunk(completed_chunks[index], shard)
+                continue
+
+            chunk = next(generated_chunks)
+            self._write_chunk(index, shard, chunk)
+            yield chunk
+
+    @log_time
+    def generate_dataset(self) -> Dataset:
+        return Dataset([pair for chunk in self.generate_chunks() for pair in chunk], self.dataset_type)
+
+    def finish(self, output_files: List[Path]) -> None:
+        """Record the output files written from the chunks."""
+        self.manifest["output_files"] = [str(file_path) for file_path in output_files]
+        self._save_manifest()
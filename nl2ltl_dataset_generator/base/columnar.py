@@ -0,0 +1,148 @@
+import random
+from typing import List, Generator, Any, Iterable, Sequence, Union
+
+import numpy as np
+
+from nl2ltl_dataset_generator.base.core import PairGenerationStrategy, TermBuilder
+from nl2ltl_dataset_generator.base.data_model import DatasetType, Identifier, Pair, PairTerm, PairType, Dataset, \
+    LogicalOperator
+from nl2ltl_dataset_generator.base.log import log_time
+
+MAX_TERMS = 3
+LOGICAL_OPERATORS = [LogicalOperator.AND, LogicalOperator.OR]
+
+PAIR_DTYPE = np.dtype([
+    ("pair_type", np.uint8),
+    # identifier ids of each term slot, -1 where the term has fewer identifiers or the pair fewer terms
+    ("identifiers", np.int32, (MAX_TERMS, TermBuilder.MAX_DIMENSION)),
+    # index in LOGICAL_OPERATORS, -1 for terms made of a single identifier
+    ("logical_operators", np.int8, (MAX_TERMS,)),
+    # seed of the random stream choosing phrase templates, logical operator variants and determiners
+    ("render_seed", np.uint64),
+])
+
+
+class ColumnarDataset:
+    """A Dataset stored as a NumPy structured array of small integers, see PAIR_DTYPE.
+
+    Identifiers are stored once in a table and referenced by id, phrases and formulas are rendered only when the pairs
+    are read back. Slicing, shuffling and splitting only move integer rows.
+    """
+    def __init__(self, pair_types: List[PairType], dataset_type: DatasetType, identifiers: List[Identifier] = None,
+                 rows: np.ndarray = None):
+        self.pair_types = pair_types
+        self.dataset_type = dataset_type
+        self.identifiers = list(identifiers) if identifiers is not None else []
+        self._identifier_ids = {identifier: index for index, identifier in enumerate(self.identifiers)}
+        self._pair_type_ids = {str(pair_type): index for index, pair_type in enumerate(pair_types)}
+        # pairs generated in other processes carry copies of the PairType objects, so these are matched by name and
+        # cached by identity, keeping a reference so that ids are not reused
+        self._pair_type_object_ids = {}
+        self._chunks = [rows] if rows is not None else []
+
+    @property
+    def rows(self) -> np.ndarray:
+        if len(self._chunks) != 1:
+            self._chunks = [np.concatenate(self._chunks) if self._chunks else np.empty(0, PAIR_DTYPE)]
+        return self._chunks[0]
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self._chunks)
+
+    def _get_identifier_id(self, identifier: Identifier) -> int:
+        if (identifier_id := self._identifier_ids.get(identifier)) is None:
+            identifier_id = self._identifier_ids[identifier] = len(self.identifiers)
+            self.identifiers.append(identifier)
+        return identifier_id
+
+    def _get_pair_type_id(self, pair_type: PairType) -> int:
+        if (cached := self._pair_type_object_ids.get(id(pair_type))) is None:
+            cached = self._pair_type_object_ids[id(pair_type)] = (pair_type, self._pair_type_ids[str(pair_type)])
+        return cached[1]
+
+    def append(self, pairs: Iterable[Pair], rng=random) -> None:
+        """Encode the (unrendered) pairs, drawing their render seeds from rng."""
+        pairs = list(pairs)
+        identifiers = np.full((len(pairs), *PAIR_DTYPE["identifiers"].shape), -1, np.int32)
+        logical_operators = np.full((len(pairs), MAX_TERMS), -1, np.int8)
+
+        for row_index, pair in enumerate(pairs):
+            for term_index, term in enumerate(pair.terms):
+                if term.logical_operator is not None:
+                    logical_operators[row_index, term_index] = LOGICAL_OPERATORS.index(term.logical_operator)
+                for identifier_index, identifier in enumerate(term.identifiers):
+                    identifiers[row_index, term_index, identifier_index] = self._get_identifier_id(identifier)
+
+        rows = np.empty(len(pairs), PAIR_DTYPE)
+        rows["pair_type"] = [self._get_pair_type_id(pair.pair_type) for pair in pairs]
+        rows["identifiers"] = identifiers
+        rows["logical_operators"] = logical_operators
+        rows["render_seed"] = [rng.getrandbits(64) for _ in pairs]
+
+        self._chunks.append(rows)
+
+    def _with_rows(self, rows: np.ndarray) -> "ColumnarDataset":
+        dataset = ColumnarDataset(self.pair_types, self.dataset_type, rows=rows)
+        # the identifiers table is shared, not copied
+        dataset.identifiers = self.identifiers
+        dataset._identifier_ids = self._identifier_ids
+        return dataset
+
+    def __getitem__(self, key: Union[int, slice, Sequence[int], np.ndarray]) -> Union[Pair, "ColumnarDataset"]:
+        if isinstance(key, (int, np.integer)):
+            return self.get_pair(key)
+        return self._with_rows(self.rows[key])
+
+    def shuffle(self, seed: int = None) -> "ColumnarDataset":
+        return self[np.random.default_rng(seed).permutation(len(self))]
+
+    def split(self, *fractions: float) -> List["ColumnarDataset"]:
+        """Split the rows in contiguous parts, one per fraction plus one with the remaining rows."""
+        bounds = np.cumsum([0, *(int(round(fraction * len(self))) for fraction in fractions)])
+        if bounds[-1] > len(self):
+            raise ValueError(f"The fractions {fractions} sum to more than 1.")
+        return [self[start:stop] for start, stop in zip(bounds, [*bounds[1:], len(self)])]
+
+    def get_pair(self, index: int, render: bool = True) -> Pair:
+        row = self.rows[index]
+        pair_type = self.pair_types[row["pair_type"]]
+        terms = []
+
+        for term_index in range(pair_type.n_terms):
+            identifiers = [self.identifiers[identifier_id] for identifier_id in row["identifiers"][term_index] if identifier_id >= 0]
+            logical_operator = row["logical_operators"][term_index]
+            terms.append(PairTerm(identifiers, LOGICAL_OPERATORS[logical_operator] if logical_operator >= 0 else None))
+
+        pair = Pair(terms, pair_type)
+
+        if render:
+            pair.update_phrase(random.Random(int(row["render_seed"])))
+            pair.update_formula()
+
+        return pair
+
+    def iter_pairs(self, render: bool = True) -> Generator[Pair, Any, None]:
+        for index in range(len(self)):
+            yield self.get_pair(index, render)
+
+    def iter_chunks(self, chunk_size: int = 10000) -> Generator[List[Pair], Any, None]:
+        """Render the pairs in chunks, e.g. for save_csv_stream."""
+        for start in range(0, len(self), chunk_size):
+            yield list(self[start:start + chunk_size].iter_pairs())
+
+    def to_dataset(self) -> Dataset:
+        return Dataset(list(self.iter_pairs()), self.dataset_type)
+
+
+@log_time
+def generate_columnar_dataset(generation_strategy: PairGenerationStrategy, dataset_type: DatasetType, seed: int,
+                              shard_size: int) -> ColumnarDataset:
+    """Generate the pairs of every shard without rendering them, each shard drawing from its own random stream."""
+    dataset_distribution = generation_strategy.dataset_distribution
+    dataset = ColumnarDataset(dataset_distribution.pair_types, dataset_type, generation_strategy.identifiers)
+
+    for shard in dataset_distribution.get_shards(seed, shard_size):
+        rng = random.Random(shard.seed)
+        dataset.append(list(generation_strategy.get_shard_pairs(shard, rng)), rng)
+
+    return dataset
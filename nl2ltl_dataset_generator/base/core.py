@@ -1,3 +1,4 @@
+import dataclasses
 import itertools
 import math
 import random
@@ -5,14 +6,13 @@ import string
 from abc import ABC
 from enum import Enum
 from pathlib import Path
-from typing import List, Generator, Tuple, Any
-
-import numpy as np
+from typing import List, Generator, Tuple, Any, Iterable, Sequence
 
 from nl2ltl_dataset_generator.base.data_model import DatasetDistribution, DatasetType, Identifier, Pair, PairTerm, LogicalOperator, PairType, \
-    RestrictedIdentifier, Dataset
+    RestrictedIdentifier, Dataset, Shard, RESTRICTED_DETERMINERS, derive_seed
+from nl2ltl_dataset_generator.base.exceptions import NotEnoughUniquePairs
 from nl2ltl_dataset_generator.base.loader import load_unrestricted_identifiers
-from nl2ltl_dataset_generator.base.log import log_time
+from nl2ltl_dataset_generator.base.log import log_time, SAMPLING_SCOPE
 
 
 class TermBuildingMode(Enum):
@@ -35,7 +35,7 @@ class TermBuilder:
         self.terms_dimension = dimension
         self.building_mode = mode
 
-    @log_time
+    @log_time(scope=SAMPLING_SCOPE)
     def _term_generator(self, identifiers: List[Identifier], dimension: int) -> Generator[PairTerm, Any, None]:
         """Generate terms of a given dimension, where the dimension is the number of identifiers."""
         if dimension > 1:
@@ -46,58 +46,124 @@ class TermBuilder:
             for permutation in itertools.permutations(identifiers, dimension):
                 yield PairTerm([*permutation])
 
-    @log_time
-    def get_terms(self, identifiers: List[Identifier]) -> Generator[PairTerm, Any, None]:
-        """Generate all the requested terms"""
+    def _get_dimensions(self) -> range:
         if self.building_mode == TermBuildingMode.EQUALS:
-            return self._term_generator(identifiers, self.terms_dimension)
+            return range(self.terms_dimension, self.terms_dimension + 1)
 
-        dimensions = (
+        return (
             range(1, self.terms_dimension + 1)
             if self.building_mode == TermBuildingMode.LEQ
             else range(self.terms_dimension, self.MAX_DIMENSION + 1)
         )
 
+    @log_time(scope=SAMPLING_SCOPE)
+    def get_terms(self, identifiers: List[Identifier]) -> Generator[PairTerm, Any, None]:
+        """Generate all the requested terms"""
         return (
             pair_term
-            for dimension in dimensions
+            for dimension in self._get_dimensions()
             for pair_term in self._term_generator(identifiers, dimension)
         )
 
+    def _count_dimension_terms(self, n_identifiers: int, dimension: int) -> int:
+        n_permutations = math.perm(n_identifiers, dimension)
+        return n_permutations * len(self.LOGICAL_OPERATORS) if dimension > 1 else n_permutations
 
-# total_dispositions = n!/(n-k)!, i want to know n.
-@log_time
-def calculate_sample_number_dispositions(total_dispositions: int, k: int, maximum_n: int):
-    # print(f"DATI1: {total_dispositions}, {k}, {maximum_n}")
-    for n in range(20, maximum_n, 5):
-        if (disp := math.factorial(n)/(math.factorial(n-k))) > total_dispositions:
-            # print(f"DATI2: {disp}")
-            return n
+    def count_terms(self, n_identifiers: int) -> int:
+        """Number of terms get_terms generates from n_identifiers identifiers."""
+        return sum(self._count_dimension_terms(n_identifiers, dimension) for dimension in self._get_dimensions())
+
+    def get_term(self, identifiers: List[Identifier], index: int) -> PairTerm:
+        """Build the index-th term generated by get_terms, without generating the previous ones."""
+        for dimension in self._get_dimensions():
+            n_dimension_terms = self._count_dimension_terms(len(identifiers), dimension)
+
+            if index >= n_dimension_terms:
+                index -= n_dimension_terms
+                continue
+
+            if dimension == 1:
+                return PairTerm(get_permutation(identifiers, dimension, index))
+
+            symbol_index, index = divmod(index, math.perm(len(identifiers), dimension))
+            return PairTerm(get_permutation(identifiers, dimension, index), self.LOGICAL_OPERATORS[symbol_index])
+
+        raise IndexError(f"Term index out of range for {len(identifiers)} identifiers.")
+
+
+def get_permutation(items: Sequence, k: int, index: int) -> list:
+    """Get the index-th permutation of k elements of items, in the order itertools.permutations generates them."""
+    positions = []
+
+    for i in range(k):
+        digit, index = divmod(index, math.perm(len(items) - i - 1, k - i - 1))
+
+        # the digit-th position among the ones not taken yet
+        for taken in sorted(positions):
+            if taken <= digit:
+                digit += 1
 
-    # print(maximum_n)
-    return maximum_n
+        positions.append(digit)
+
+    return [items[position] for position in positions]
+
+
+def sample_unique_indices(population: int, n_samples: int, rng=random) -> Generator[int, Any, None]:
+    """Lazily draw n_samples distinct integers in [0, population), in random order.
+
+    The cost is proportional to n_samples: the population is only enumerated when most of it has to be drawn.
+    """
+    if 2 * n_samples > population:
+        indices = list(range(population))
+        rng.shuffle(indices)
+        yield from indices[:n_samples]
+        return
+
+    drawn = set()
+    while len(drawn) < n_samples:
+        if (index := rng.randrange(population)) not in drawn:
+            drawn.add(index)
+            yield index
+
+
+def iter_unique_indices(population: int, excluded: Iterable[int], rng=random) -> Generator[int, Any, None]:
+    """Lazily draw the integers in [0, population) that are not excluded, in random order, until none is left."""
+    drawn = set(excluded)
+    while len(drawn) < population:
+        if (index := rng.randrange(population)) not in drawn:
+            drawn.add(index)
+            yield index
 
 
 class Sampler:
+    """Sample unique pairs of a PairType by drawing indices in the space of the pairs of distinct terms.
 
-    @staticmethod
-    @log_time
-    def get_pairs(terms: List[PairTerm], pair_type: PairType) -> List[Pair]:
-        n = int(np.around(calculate_sample_number_dispositions(pair_type.distribution.new_value, pair_type.n_terms, len(terms))))
+    Indices are decoded directly into the terms of the pair, so neither the terms nor the pairs are enumerated.
+    """
+    def __init__(self, identifiers: List[Identifier], pair_type: PairType):
+        terms_dimension, term_building_mode = get_terms_dimension(pair_type.n_terms)
 
-        random.shuffle(terms)
+        self.term_builder = TermBuilder(terms_dimension, term_building_mode)
+        self.identifiers = identifiers
+        self.pair_type = pair_type
+        self.n_available_terms = self.term_builder.count_terms(len(identifiers))
+        self.n_available_pairs = math.perm(self.n_available_terms, pair_type.n_terms)
 
-        samples = random.sample(terms, n)
+    def get_pair(self, index: int) -> Pair:
+        term_indices = get_permutation(range(self.n_available_terms), self.pair_type.n_terms, index)
+        return Pair([self.term_builder.get_term(self.identifiers, term_index) for term_index in term_indices], self.pair_type)
 
-        if pair_type.n_terms != 1:
-            samples = list(itertools.permutations(samples, pair_type.n_terms))
-        else:
-            samples = [[sample] for sample in samples]
+    def sample_indices(self, n_samples: int = None, rng=random) -> Generator[int, Any, None]:
+        n_samples = n_samples if n_samples is not None else self.pair_type.distribution.new_value
+
+        if n_samples > self.n_available_pairs:
+            raise NotEnoughUniquePairs(self.pair_type, n_samples, self.n_available_pairs)
 
-        samples = random.sample(samples, pair_type.distribution.new_value)
+        return sample_unique_indices(self.n_available_pairs, n_samples, rng)
 
-        for sample in samples:
-            yield Pair([*sample], pair_type)
+    @log_time(scope=SAMPLING_SCOPE)
+    def get_pairs(self, n_samples: int = None, rng=random) -> Generator[Pair, Any, None]:
+        return (self.get_pair(index) for index in self.sample_indices(n_samples, rng))
 
 
 def get_terms_dimension(n_terms: int) -> Tuple[int, TermBuildingMode]:
@@ -113,51 +179,68 @@ def get_terms_dimension(n_terms: int) -> Tuple[int, TermBuildingMode]:
 
 class RestrictedIdentifierGenerator:
     """Generate a Restricted identifier."""
-    def __init__(self):
+    def __init__(self, rng=random):
         self.min_length = 5
         self.max_length = 15
         self.letters = string.ascii_letters + '_'
+        self.rng = rng
 
     def generate_identifier(self) -> RestrictedIdentifier:
-        length = random.randint(self.min_length, self.max_length)
-        identifier_string = ''.join([random.choice(self.letters) for _ in range(length)])
-        return RestrictedIdentifier(["the", "a", "an", ""], identifier_string)
+        length = self.rng.randint(self.min_length, self.max_length)
+        identifier_string = ''.join([self.rng.choice(self.letters) for _ in range(length)])
+        return RestrictedIdentifier(RESTRICTED_DETERMINERS, identifier_string)
+
+    def count_identifiers(self) -> int:
+        return sum(len(self.letters) ** length for length in range(self.min_length, self.max_length + 1))
 
 
 class TermGenerator:
     """Generate a PairTerm."""
-    def __init__(self, n_identifiers: int = 2):
+    def __init__(self, n_identifiers: int = 2, rng=random):
         self.LOGICAL_OPERATORS_CHOICES = [LogicalOperator.AND, LogicalOperator.OR]
-        self.identifier_generator = RestrictedIdentifierGenerator()
+        self.identifier_generator = RestrictedIdentifierGenerator(rng)
         self.n_identifiers = n_identifiers
+        self.rng = rng
 
     def generate_term(self):
-        n_identifiers = random.randint(1, self.n_identifiers) if self.n_identifiers > 1 else 1
+        n_identifiers = self.rng.randint(1, self.n_identifiers) if self.n_identifiers > 1 else 1
 
-        chosen_symbol = random.choice(self.LOGICAL_OPERATORS_CHOICES) if n_identifiers > 1 else None
+        chosen_symbol = self.rng.choice(self.LOGICAL_OPERATORS_CHOICES) if n_identifiers > 1 else None
 
         identifiers = [self.identifier_generator.generate_identifier() for _ in range(0, n_identifiers)]
 
         return PairTerm(identifiers, chosen_symbol)
 
+    def count_terms(self) -> int:
+        """Number of distinct terms generate_term can return."""
+        n_identifiers = self.identifier_generator.count_identifiers()
+        return sum(
+            n_identifiers if dimension == 1 else len(self.LOGICAL_OPERATORS_CHOICES) * n_identifiers ** dimension
+            for dimension in range(1, self.n_identifiers + 1)
+        )
+
 
 class PairsGenerator:
     """Generates a list of Pair of a given PairType."""
 
     @staticmethod
-    @log_time
-    def get_pairs(pair_type: PairType) -> List[Pair]:
+    @log_time(scope=SAMPLING_SCOPE)
+    def get_pairs(pair_type: PairType, n_samples: int = None, rng=random) -> Generator[Pair, Any, None]:
+        n_samples = n_samples if n_samples is not None else pair_type.distribution.new_value
         terms_dimension, _ = get_terms_dimension(pair_type.n_terms)
-        term_generator = TermGenerator(terms_dimension)
-        pairs = []
-        for _ in range(pair_type.distribution.new_value):
+        term_generator = TermGenerator(terms_dimension, rng)
+        for _ in range(n_samples):
             pair_terms = []
             for _ in range(pair_type.n_terms):
                 pair_terms.append(term_generator.generate_term())
 
-            pairs.append(Pair(pair_terms, pair_type))
+            yield Pair(pair_terms, pair_type)
 
-        return pairs
+    @staticmethod
+    def get_space_size(pair_type: PairType) -> Tuple[int, int]:
+        terms_dimension, _ = get_terms_dimension(pair_type.n_terms)
+        n_available_terms = TermGenerator(terms_dimension).count_terms()
+        return n_available_terms, n_available_terms ** pair_type.n_terms
 
 
 class PairGenerationStrategy(ABC):
@@ -165,63 +248,151 @@ class PairGenerationStrategy(ABC):
     def __init__(self, dataset_distribution: DatasetDistribution, identifiers: List[Identifier] = None):
         self.dataset_distribution = dataset_distribution
         self.identifiers = identifiers
+        # shards are rendered by a BatchRenderer, see generate_shard
+        self.batch_rendering = False
+
+    def iter_pairs(self) -> Generator[Pair, Any, None]:
+        """Lazily generate the pairs of every PairType, one PairType after the other."""
+        pass
 
     def get_pairs(self) -> List[Pair]:
+        return list(self.iter_pairs())
+
+    def get_shard_pairs(self, shard: Shard, rng: random.Random) -> Generator[Pair, Any, None]:
+        """Lazily generate the pairs of a single Shard, drawing from the given random stream."""
+        pass
+
+    def get_space_size(self, pair_type_index: int) -> Tuple[int, int]:
+        """Number of distinct terms and of distinct pairs that can be generated for a PairType."""
         pass
 
+    def prepare_shard(self, shard: Shard) -> Shard:
+        """Get the Shard to send to a worker process, e.g. with the part of its work that is shared by a PairType."""
+        return shard
+
 
 class RestrictedPairGenerationStrategy(PairGenerationStrategy):
-    """Generates a set of Restricted Pair."""
-    def __init__(self, dataset_distribution: DatasetDistribution):
+    """Generates a set of Restricted Pair.
+
+    Shards are generated in batches by a RestrictedPairsBatchGenerator, unless batched is False.
+    """
+    def __init__(self, dataset_distribution: DatasetDistribution, batched: bool = True):
         super(RestrictedPairGenerationStrategy, self).__init__(dataset_distribution)
+        self.batched = batched
 
-    @log_time
-    def get_pairs(self) -> List[Pair]:
-        pair_types = self.dataset_distribution.pair_types
-        pairs = []
+    def iter_pairs(self) -> Generator[Pair, Any, None]:
+        for pair_type in self.dataset_distribution.pair_types:
+            yield from PairsGenerator.get_pairs(pair_type)
 
-        for pair_type in pair_types:
-            pairs.extend(PairsGenerator.get_pairs(pair_type))
+    def get_shard_pairs(self, shard: Shard, rng: random.Random) -> Generator[Pair, Any, None]:
+        pair_type = self.dataset_distribution.pair_types[shard.pair_type_index]
 
-        return pairs
+        if self.batched:
+            # NumPy is only imported when restricted pairs are actually generated
+            from nl2ltl_dataset_generator.base.batch import get_restricted_pairs_batch_generator
+            return get_restricted_pairs_batch_generator(rng).get_pairs(pair_type, len(shard))
+
+        return PairsGenerator.get_pairs(pair_type, len(shard), rng)
+
+    def get_space_size(self, pair_type_index: int) -> Tuple[int, int]:
+        return PairsGenerator.get_space_size(self.dataset_distribution.pair_types[pair_type_index])
+
+    @log_time
+    def get_pairs(self) -> List[Pair]:
+        return list(self.iter_pairs())
 
 
 @log_time
-def unrestricted_from_type(pair_type: PairType, identifiers: List[Identifier]) -> List[Pair]:
-    terms_dimension, term_building_mode = get_terms_dimension(pair_type.n_terms)
+def unrestricted_from_type(pair_type: PairType, identifiers: List[Identifier], rng=random) -> Generator[Pair, Any, None]:
+    return Sampler(identifiers, pair_type).get_pairs(rng=rng)
 
-    term_builder = TermBuilder(terms_dimension, term_building_mode)
-    terms = list(term_builder.get_terms(identifiers))
 
-    return Sampler.get_pairs(terms, pair_type)
+# key of the random stream extending the selection of a PairType past its requested samples
+EXTENSION_KEY = 1
 
 
 class UnrestrictedPairGenerationStrategy(PairGenerationStrategy):
     """Generates a set of Unrestricted Pair."""
     def __init__(self, dataset_distribution: DatasetDistribution, identifiers: List[Identifier]):
         super(UnrestrictedPairGenerationStrategy, self).__init__(dataset_distribution, identifiers)
+        self._selection_key = None
+        self._selection = None
+        self._extension = None
+        self._samplers = {}
 
-    @log_time
-    def get_pairs(self) -> List[Pair]:
-        pair_types = self.dataset_distribution.pair_types
-        pairs = []
+    def iter_pairs(self) -> Generator[Pair, Any, None]:
+        for pair_type in self.dataset_distribution.pair_types:
+            yield from unrestricted_from_type(pair_type, self.identifiers)
+
+    def get_sampler(self, pair_type_index: int) -> Sampler:
+        if pair_type_index not in self._samplers:
+            pair_type = self.dataset_distribution.pair_types[pair_type_index]
+            self._samplers[pair_type_index] = Sampler(self.identifiers, pair_type)
+
+        return self._samplers[pair_type_index]
 
-        for pair_type in pair_types:
-            pairs.extend(unrestricted_from_type(pair_type, self.identifiers))
+    def get_space_size(self, pair_type_index: int) -> Tuple[int, int]:
+        sampler = self.get_sampler(pair_type_index)
+        return sampler.n_available_terms, sampler.n_available_pairs
 
-        return pairs
+    def get_shard_indices(self, shard: Shard) -> List[int]:
+        sampler = self.get_sampler(shard.pair_type_index)
+
+        # Unique pairs are sampled over the whole PairType, hence from the PairType stream rather than the shard one.
+        # Only the indices of the last PairType are kept, since shards of the same PairType come one after the other.
+        if self._selection_key != (key := (shard.pair_type_index, shard.pair_type_seed)):
+            self._selection = list(sampler.sample_indices(rng=random.Random(shard.pair_type_seed)))
+            self._selection_key = key
+            self._extension = None
+
+        # shards past the requested samples, e.g. the ones replacing duplicates, extend the selection with new indices
+        if shard.stop > len(self._selection):
+            if self._extension is None:
+                extension_rng = random.Random(derive_seed(shard.pair_type_seed, EXTENSION_KEY))
+                self._extension = iter_unique_indices(sampler.n_available_pairs, self._selection, extension_rng)
+
+            self._selection.extend(itertools.islice(self._extension, shard.stop - len(self._selection)))
+
+            if shard.stop > len(self._selection):
+                raise NotEnoughUniquePairs(sampler.pair_type, shard.stop, sampler.n_available_pairs)
+
+        return self._selection[shard.start:shard.stop]
+
+    def prepare_shard(self, shard: Shard) -> Shard:
+        # the selection is drawn once, here, and each worker only receives the indices of its shard
+        return dataclasses.replace(shard, indices=self.get_shard_indices(shard))
+
+    def get_shard_pairs(self, shard: Shard, rng: random.Random) -> Generator[Pair, Any, None]:
+        sampler = self.get_sampler(shard.pair_type_index)
+        indices = shard.indices if shard.indices is not None else self.get_shard_indices(shard)
+        return (sampler.get_pair(index) for index in indices)
+
+    def __getstate__(self):
+        # the selection stays in the process drawing it, workers get the indices through prepare_shard
+        state = self.__dict__.copy()
+        state.update(_selection_key=None, _selection=None, _extension=None)
+        return state
+
+    @log_time
+    def get_pairs(self) -> List[Pair]:
+        return list(self.iter_pairs())
 
 
 @log_time
-def generation_strategy_factory(dataset_type: DatasetType, dataset_distribution: DatasetDistribution, file_path: Path = None) -> PairGenerationStrategy:
+def generation_strategy_factory(dataset_type: DatasetType, dataset_distribution: DatasetDistribution, file_path: Path = None,
+                                batch_rendering: bool = False, identifiers_sample_size: int = None,
+                                rng=random) -> PairGenerationStrategy:
     if dataset_type is DatasetType.RESTRICTED:
-        return RestrictedPairGenerationStrategy(dataset_distribution)
+        generation_strategy = RestrictedPairGenerationStrategy(dataset_distribution)
+    else:
+        if file_path is None:
+            exit(-1) # todo: gestire eccezione
 
-    if file_path is None:
-        exit(-1) # todo: gestire eccezione
+        identifiers = load_unrestricted_identifiers(file_path, identifiers_sample_size, rng)
+        generation_strategy = UnrestrictedPairGenerationStrategy(dataset_distribution, identifiers)
 
-    identifiers = load_unrestricted_identifiers(file_path)
-    return UnrestrictedPairGenerationStrategy(dataset_distribution, identifiers)
+    generation_strategy.batch_rendering = batch_rendering
+    return generation_strategy
 
 
 @log_time
@@ -233,6 +404,14 @@ def generate_strings(pairs: List[Pair]) -> List[Pair]:
     return pairs
 
 
+def iter_strings(pairs: Iterable[Pair], rng=random) -> Generator[Pair, Any, None]:
+    """Lazy counterpart of generate_strings: each pair is rendered only when it is consumed."""
+    for pair in pairs:
+        pair.update_phrase(rng)
+        pair.update_formula()
+        yield pair
+
+
 class DatasetGenerator:
     """Generates a Dataset of any kind: Restricted or Unrestricted."""
     def __init__(self, dataset_distribution: DatasetDistribution, dataset_type: DatasetType, generation_strategy: PairGenerationStrategy):
@@ -248,3 +427,13 @@ class DatasetGenerator:
 
         # crea dataset
         return Dataset(pairs, self.dataset_type)
+
+    def generate_chunks(self, chunk_size: int = 10000) -> Generator[List[Pair], Any, None]:
+        """Generate the dataset as a stream of rendered chunks of at most chunk_size pairs.
+
+        Only one chunk is alive at a time, so memory does not grow with the number of samples.
+        """
+        pairs = iter_strings(self.generation_strategy.iter_pairs())
+
+        while chunk := list(itertools.islice(pairs, chunk_size)):
+            yield chunk
@@ -1,12 +1,11 @@
 import random
+import sys
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from enum import Enum
 from typing import List, Callable
 
-import numpy as np
-
-from nl2ltl_dataset_generator.base.log import log_time
+from nl2ltl_dataset_generator.base.log import log_time, RENDERING_SCOPE
 
 
 class DatasetType(Enum):
@@ -45,26 +44,49 @@ class PhraseTemplate:
     phrase_template: str
 
 
-@dataclass
 class FormulaTemplate:
-    def __init__(self):
-        self._fn_list = []
-        self._is_empty = True
+    """A formula skeleton made of literal strings and term slots, rendered in a single pass.
+
+    Calling it with the terms of a pair, as in formula_template(*terms), returns the formula.
+    """
+    def __init__(self, name: str = None):
+        self.name = name
+        self.parts = []
+
+    def append_string(self, string: str) -> None:
+        if not string:
+            return
+
+        if self.parts and isinstance(self.parts[-1], str):
+            self.parts[-1] += string
+        else:
+            self.parts.append(string)
+
+    def append_term_by_index(self, term_index: int) -> None:
+        self.parts.append(term_index)
+
+    @property
+    def n_terms(self) -> int:
+        return len({part for part in self.parts if isinstance(part, int)})
 
-    def append_string(self, string: str):
-        def string_function():
-            return string
+    def get_string(self, terms) -> str:
+        return ''.join([part if part.__class__ is str else terms[part].get_formula_string() for part in self.parts])
 
-        self._fn_list.append(string_function)
+    def __call__(self, *terms) -> str:
+        return self.get_string(terms)
 
-    def append_term_by_index(self, term_index):
-        def term_function(terms):
-            return terms[term_index]
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name!r}, {self.parts!r})"
 
-    def get_string(self, terms):
-        final_string = ""
-        for fn in self._fn_list:
-            final_string = final_string + " " + fn(terms)
+    def __reduce__(self):
+        # pickled with its parts, templates registered at run time may be missing in other processes
+        return _formula_template_from_parts, (self.name, self.parts)
+
+
+def _formula_template_from_parts(name: str, parts: list) -> FormulaTemplate:
+    formula_template = FormulaTemplate(name)
+    formula_template.parts = list(parts)
+    return formula_template
 
 
 @dataclass
@@ -76,57 +98,107 @@ class PairTypeDistribution:
 
 @dataclass
 class PairType:
-    pattern: Pattern
-    scope: Scope
+    # names of the pattern and of the scope, e.g. those of Pattern and Scope or of declared patterns
+    pattern: str
+    scope: str
     n_terms: int
     phrase_templates: Callable = None  # todo: remove None
     formula_template: Callable = None  # todo: remove None
     distribution: PairTypeDistribution = None
 
+    def __str__(self):
+        return f"{self.pattern}_{self.scope}"
+
 
-@dataclass
 class Identifier(ABC):
-    pass
+    """An immutable atomic proposition, with its representations in the phrases and in the formulas."""
+    __slots__ = ()
+
+    _fields = ()
 
     @abstractmethod
-    def get_phrase_string(self):
+    def get_phrase_string(self, rng=random):
         pass
 
     @abstractmethod
     def get_formula_string(self):
         pass
 
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def _key(self) -> tuple:
+        return tuple(getattr(self, field) for field in self._fields)
+
+    def __eq__(self, other):
+        return self.__class__ is other.__class__ and self._key() == other._key()
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({', '.join(f'{field}={getattr(self, field)!r}' for field in self._fields)})"
+
+    def __reduce__(self):
+        return self.__class__, self._key()
+
 
-@dataclass
 class UnrestrictedIdentifier(Identifier):
-    determiners: List[str]
-    noun: str
-    verb: List[str]
-    aux: List[str] = None
+    """Identifier made of a noun and an action, e.g. "the car has stopped" and "car_has_stopped".
 
-    @log_time
-    def get_phrase_string(self):
-        determiner = random.choice(self.determiners)
-        formula_action = ' '.join(self.aux + self.verb) if self.aux is not None else ' '.join(self.verb)
-        formula_action = formula_action.strip()
-        return f"{determiner} {self.noun} {formula_action}"
+    Both representations are rendered once at construction: the formula string is interned and there is one phrase
+    string per determiner.
+    """
+    __slots__ = ("determiners", "noun", "verb", "aux", "formula_string", "phrase_strings", "_hash")
+
+    _fields = ("determiners", "noun", "verb", "aux")
+
+    def __init__(self, determiners: List[str], noun: str, verb: List[str], aux: List[str] = None):
+        object.__setattr__(self, "determiners", tuple(determiners))
+        object.__setattr__(self, "noun", noun)
+        object.__setattr__(self, "verb", tuple(verb))
+        object.__setattr__(self, "aux", tuple(aux) if aux is not None else None)
+
+        words = (*aux, *verb) if aux is not None else tuple(verb)
+        phrase_action = ' '.join(words).strip()
+        object.__setattr__(self, "formula_string", sys.intern(f"{noun}_{'_'.join(words)}"))
+        object.__setattr__(self, "phrase_strings", tuple(f"{determiner} {noun} {phrase_action}" for determiner in determiners))
+        object.__setattr__(self, "_hash", hash(self._key()))
+
+    def get_phrase_string(self, rng=random):
+        return rng.choice(self.phrase_strings)
 
-    @log_time
     def get_formula_string(self):
-        formula_action = '_'.join(self.aux + self.verb) if self.aux is not None else '_'.join(self.verb)
-        return f"{self.noun}_{formula_action}"
+        return self.formula_string
+
+
+RESTRICTED_DETERMINERS = ("the", "a", "an", "")
 
 
-@dataclass
 class RestrictedIdentifier(Identifier):
-    determiners: List[str]
-    random_identifier: str
+    """Identifier made of a random sequence of characters, the same in the phrases and in the formulas."""
+    __slots__ = ("determiners", "random_identifier")
 
-    @log_time
-    def get_phrase_string(self):
+    _fields = ("determiners", "random_identifier")
+
+    def __init__(self, determiners: List[str], random_identifier: str):
+        object.__setattr__(self, "determiners", tuple(determiners))
+        object.__setattr__(self, "random_identifier", random_identifier)
+
+    def __hash__(self):
+        # strings cache their hash, so there is no need to store it
+        return hash(self.random_identifier)
+
+    @property
+    def phrase_strings(self) -> tuple:
+        return self.random_identifier,
+
+    def get_phrase_string(self, rng=random):
         return self.random_identifier
 
-    @log_time
     def get_formula_string(self):
         return self.random_identifier
 
@@ -144,6 +216,12 @@ class PairTerm:
     def __len__(self):
         return len(self.identifiers)
 
+    def get_formula_string(self) -> str:
+        if self.logical_operator is None:
+            return self.identifiers[0].get_formula_string()
+
+        return f" {self.logical_operator.value} ".join([identifier.get_formula_string() for identifier in self.identifiers])
+
 
 @dataclass
 class Pair:
@@ -152,15 +230,42 @@ class Pair:
     phrase: str = None
     formula: str = None
 
-    @log_time
-    def update_phrase(self):
-        self.phrase = self.pair_type.phrase_templates(self.terms)
+    @log_time(scope=RENDERING_SCOPE)
+    def update_phrase(self, rng=random):
+        self.phrase = self.pair_type.phrase_templates(self.terms, rng)
 
-    @log_time
+    @log_time(scope=RENDERING_SCOPE)
     def update_formula(self):
         self.formula = self.pair_type.formula_template(*self.terms)
 
 
+@dataclass
+class Shard:
+    """A contiguous slice [start, stop) of the samples of a single PairType, generated with its own random stream.
+
+    indices are the pair indices of the slice when they are drawn before the shard is sent to a worker.
+    """
+    pair_type_index: int
+    shard_index: int
+    start: int
+    stop: int
+    pair_type_seed: int
+    seed: int
+    indices: List[int] = None
+
+    def __len__(self):
+        return self.stop - self.start
+
+
+def derive_seed(seed: int, *key: int) -> int:
+    """Derive an independent seed from the dataset seed and a key, e.g. (pair type index, shard index)."""
+    # imported here, so that importing the data model does not pay for NumPy
+    import numpy as np
+
+    state = np.random.SeedSequence(seed, spawn_key=key).generate_state(2, np.uint64)
+    return int(state[0]) << 64 | int(state[1])
+
+
 class DatasetDistribution:
 
     @log_time
@@ -171,7 +276,7 @@ class DatasetDistribution:
 
     def _calculate_new_info(self, pair_type_distribution: PairTypeDistribution):
         pair_type_distribution.percentage = pair_type_distribution.old_value / self.old_values_total
-        pair_type_distribution.new_value = int(np.around(self.n_samples * pair_type_distribution.percentage))
+        pair_type_distribution.new_value = round(self.n_samples * pair_type_distribution.percentage)
 
     def update_info(self) -> None:
         remaining_samples = self.n_samples
@@ -183,6 +288,26 @@ class DatasetDistribution:
         self.pair_types[-1].distribution.percentage = self.pair_types[-1].distribution.old_value / self.old_values_total
         self.pair_types[-1].distribution.new_value = remaining_samples
 
+    def get_shards(self, seed: int, shard_size: int) -> List[Shard]:
+        """Split the samples of each PairType in shards of at most shard_size samples.
+
+        The shards and their seeds only depend on the seed and the shard size, so that the dataset does not change with
+        the number of processes generating it.
+        """
+        shards = []
+
+        for pair_type_index, pair_type in enumerate(self.pair_types):
+            pair_type_seed = derive_seed(seed, pair_type_index)
+            n_samples = pair_type.distribution.new_value
+
+            for shard_index, start in enumerate(range(0, n_samples, shard_size)):
+                shards.append(Shard(
+                    pair_type_index, shard_index, start, min(start + shard_size, n_samples),
+                    pair_type_seed, derive_seed(seed, pair_type_index, shard_index)
+                ))
+
+        return shards
+
 
 @dataclass
 class Dataset:
@@ -0,0 +1,254 @@
+import hashlib
+import math
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Generator, Any, Dict, Callable, Iterable, Tuple, Optional
+
+from nl2ltl_dataset_generator.base.data_model import Pair, Shard, Dataset, derive_seed
+from nl2ltl_dataset_generator.base.exceptions import NotEnoughUniquePairs, InvalidPairIndex
+from nl2ltl_dataset_generator.base.log import log_time
+from nl2ltl_dataset_generator.base.ltl import hash_formula
+from nl2ltl_dataset_generator.base.parallel import ShardedDatasetGenerator, generate_shard
+
+DEFAULT_MEMORY_LIMIT = 256 * 2 ** 20
+DEFAULT_MAX_RETRIES = 100
+# measured size of a set of 64-bit integers, entries included
+SET_BYTES_PER_ROW = 70
+MAX_BLOOM_HASHES = 16
+MASK_32 = 2 ** 32 - 1
+
+
+def hash_row(pair: Pair) -> int:
+    """64-bit digest of the (ltl, en) row of a rendered pair."""
+    digest = hashlib.blake2b(f"{pair.formula}\n{pair.phrase}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+# what identifies a row, see DeduplicatedDatasetGenerator
+dedup_keys: Dict[str, Callable[[Pair], int]] = {
+    "row": hash_row,
+    "formula": hash_formula,
+}
+
+
+class BloomFilter:
+    """A fixed-size Bloom filter of 64-bit digests, using double hashing on their two halves."""
+    def __init__(self, n_bytes: int, expected_rows: int):
+        self.n_bits = max(n_bytes, 1) * 8
+        self.n_hashes = min(max(round(self.n_bits / max(expected_rows, 1) * math.log(2)), 1), MAX_BLOOM_HASHES)
+        self.bits = bytearray(max(n_bytes, 1))
+
+    def add(self, digest: int) -> bool:
+        """Add the digest, returns False if it was (possibly) already there."""
+        first, second = digest & MASK_32, (digest >> 32) | 1
+        is_new = False
+
+        for index in range(self.n_hashes):
+            bit = (first + index * second) % self.n_bits
+            byte_index, mask = bit >> 3, 1 << (bit & 7)
+            if not self.bits[byte_index] & mask:
+                self.bits[byte_index] |= mask
+                is_new = True
+
+        return is_new
+
+
+class SeenRows:
+    """The digests of the rows seen so far.
+
+    The digests are kept in a set until it would exceed memory_limit bytes, then they move to a Bloom filter of that
+    size: memory stops growing, at the cost of rejecting a few unique rows as false positives.
+    """
+    def __init__(self, memory_limit: int = DEFAULT_MEMORY_LIMIT, expected_rows: int = 0):
+        self.memory_limit = memory_limit
+        self.expected_rows = expected_rows
+        self.digests = set()
+        self.bloom_filter: BloomFilter = None
+
+    @property
+    def is_exact(self) -> bool:
+        return self.bloom_filter is None
+
+    def add(self, digest: int) -> bool:
+        """Add the digest of a row, returns False if the row was already seen."""
+        if self.bloom_filter is not None:
+            return self.bloom_filter.add(digest)
+
+        if digest in self.digests:
+            return False
+
+        if (len(self.digests) + 1) * SET_BYTES_PER_ROW > self.memory_limit:
+            self.bloom_filter = BloomFilter(self.memory_limit, self.expected_rows)
+            for seen_digest in self.digests:
+                self.bloom_filter.add(seen_digest)
+            self.digests = set()
+            return self.bloom_filter.add(digest)
+
+        self.digests.add(digest)
+        return True
+
+
+@dataclass
+class DeduplicationStats:
+    pair_type: str
+    generated: int = 0
+    rejected: int = 0
+
+    @property
+    def rejection_rate(self) -> float:
+        return self.rejected / self.generated if self.generated else 0.
+
+
+class DeduplicatedDatasetGenerator:
+    """Drops the rows of a ShardedDatasetGenerator already generated and replaces them, keeping the dataset size.
+
+    Rows are (ltl, en) pairs, identified by their key, e.g. hash_formula to only keep a row for each formula up to
+    the order of the operands of its commutative operators. Each PairType is topped up right after its last shard,
+    with extra shards that follow the regular ones, so for a given seed, shard size and memory limit the dataset is
+    the same whatever the number of workers.
+    """
+    def __init__(self, sharded_dataset_generator: ShardedDatasetGenerator, memory_limit: int = DEFAULT_MEMORY_LIMIT,
+                 max_retries: int = DEFAULT_MAX_RETRIES, key: Callable[[Pair], int] = hash_row,
+                 seen_digests: Iterable[int] = ()):
+        self.sharded_dataset_generator = sharded_dataset_generator
+        self.dataset_distribution = sharded_dataset_generator.dataset_distribution
+        self.dataset_type = sharded_dataset_generator.dataset_type
+        self.memory_limit = memory_limit
+        self.max_retries = max_retries
+        self.key = key
+        # digests of rows emitted by previous runs, e.g. of the dataset being extended
+        self.seen_digests = seen_digests
+        self.seen_rows: SeenRows = None
+        self.stats: Dict[int, DeduplicationStats] = {}
+
+    def _filter(self, pair_type_index: int, pairs: List[Pair]) -> List[Pair]:
+        unique_pairs = [pair for pair in pairs if self.seen_rows.add(self.key(pair))]
+
+        stats = self.stats[pair_type_index]
+        stats.generated += len(pairs)
+        stats.rejected += len(pairs) - len(unique_pairs)
+
+        return unique_pairs
+
+    def _top_up(self, last_shard: Shard, n_shards: int) -> Generator[List[Pair], Any, None]:
+        """Generate the pairs replacing the rejected ones of the PairType of last_shard, which has n_shards shards."""
+        pair_type = self.dataset_distribution.pair_types[last_shard.pair_type_index]
+        stats = self.stats[last_shard.pair_type_index]
+        start = last_shard.stop
+
+        for retry in range(self.max_retries):
+            if (n_missing := stats.rejected - (start - last_shard.stop)) <= 0:
+                return
+
+            shard_index = n_shards + retry
+            shard = Shard(
+                last_shard.pair_type_index, shard_index, start, start + n_missing, last_shard.pair_type_seed,
+                derive_seed(self.sharded_dataset_generator.seed, last_shard.pair_type_index, shard_index)
+            )
+            start = shard.stop
+
+            if unique_pairs := self._filter(shard.pair_type_index, generate_shard(self.sharded_dataset_generator.generation_strategy, shard)):
+                yield unique_pairs
+
+        if stats.rejected > start - last_shard.stop:
+            requested = pair_type.distribution.new_value
+            raise NotEnoughUniquePairs(pair_type, requested, requested - stats.rejected + start - last_shard.stop)
+
+    def generate_chunks(self) -> Generator[List[Pair], Any, None]:
+        self.seen_rows = SeenRows(self.memory_limit, self.dataset_distribution.n_samples + len(self.seen_digests))
+        for digest in self.seen_digests:
+            self.seen_rows.add(digest)
+        self.stats = {
+            index: DeduplicationStats(str(pair_type)) for index, pair_type in enumerate(self.dataset_distribution.pair_types)
+        }
+
+        shards = self.sharded_dataset_generator.get_shards()
+        chunks = self.sharded_dataset_generator.generate_chunks()
+
+        for position, (shard, chunk) in enumerate(zip(shards, chunks)):
+            if unique_pairs := self._filter(shard.pair_type_index, chunk):
+                yield unique_pairs
+
+            if position + 1 == len(shards) or shards[position + 1].pair_type_index != shard.pair_type_index:
+                yield from self._top_up(shard, shard.shard_index + 1)
+
+    @log_time
+    def generate_dataset(self) -> Dataset:
+        return Dataset([pair for chunk in self.generate_chunks() for pair in chunk], self.dataset_type)
+
+    def get_report(self) -> str:
+        lines = [f"{'pair type':<18}{'generated':>11}{'rejected':>10}{'rate':>9}"]
+        lines.extend(
+            f"{stats.pair_type:<18}{stats.generated:>11}{stats.rejected:>10}{stats.rejection_rate:>9.2%}"
+            for stats in self.stats.values()
+        )
+        if self.seen_rows is not None and not self.seen_rows.is_exact:
+            lines.append("The memory limit was reached, duplicates were detected with a Bloom filter.")
+        return "\n".join(lines)
+
+
+class PairIndex:
+    """The digests of the rows of a dataset, persisted in a .npz file as a sorted uint64 array (8 bytes per row),
+    together with the name of the key, in dedup_keys, that computed them.
+
+    The seed and the split sizes of the dataset are saved with them, since an extension must assign the formulas to
+    the same splits as the dataset it extends.
+    """
+    def __init__(self, file_path: Path, key_name: str = "row"):
+        self.file_path = file_path
+        self.key_name = key_name
+        self.key = dedup_keys[key_name]
+        self.digests: List[int] = []
+        self._new_digests: List[int] = []
+        self.seed: int = None
+        # (test_size, val_size) of the splits, None if the dataset was never split
+        self.split_sizes: Tuple[float, Optional[float]] = None
+
+    def __len__(self) -> int:
+        return len(self.digests) + len(self._new_digests)
+
+    def load(self) -> "PairIndex":
+        # imported here, so that the index does not make every run pay for NumPy
+        import numpy as np
+
+        if not self.file_path.exists():
+            raise InvalidPairIndex(self.file_path, "the file does not exist")
+
+        with np.load(self.file_path) as index:
+            if (key_name := str(index["key"])) != self.key_name:
+                raise InvalidPairIndex(self.file_path, f"it indexes rows by {key_name}, not by {self.key_name}")
+            self.digests = index["digests"].tolist()
+            if "seed" in index:
+                self.seed = int(str(index["seed"]))
+            if "split_sizes" in index:
+                test_size, val_size = index["split_sizes"].tolist()
+                self.split_sizes = test_size, None if math.isnan(val_size) else val_size
+
+        return self
+
+    def add(self, pairs: Iterable[Pair]) -> None:
+        self._new_digests.extend(self.key(pair) for pair in pairs)
+
+    def tee(self, chunks: Iterable[List[Pair]]) -> Generator[List[Pair], Any, None]:
+        """Index each chunk and pass it on, e.g. to save_csv_stream."""
+        for chunk in chunks:
+            self.add(chunk)
+            yield chunk
+
+    def save(self) -> None:
+        """Write the loaded and the added digests, through a temporary file renamed at the end."""
+        import numpy as np
+
+        digests = np.unique(np.array([*self.digests, *self._new_digests], dtype=np.uint64))
+        temporary_path = self.file_path.with_name(f"{self.file_path.name}.tmp")
+        with temporary_path.open('wb') as fp:
+            arrays = {"digests": digests, "key": np.array(self.key_name)}
+            if self.seed is not None:
+                # as text, since the seed can be any non negative int
+                arrays["seed"] = np.array(str(self.seed))
+            if self.split_sizes is not None:
+                test_size, val_size = self.split_sizes
+                arrays["split_sizes"] = np.array([test_size, math.nan if val_size is None else val_size])
+            np.savez(fp, **arrays)
+        os.replace(temporary_path, self.file_path)
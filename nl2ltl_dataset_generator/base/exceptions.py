@@ -1,3 +1,40 @@
 class InvalidDatasetType(Exception):
     def __init__(self, input_dataset_type: str):
-        super(InvalidDatasetType, self).__init__(f"'{input_dataset_type}' is not a valid dataset type!")
\ No newline at end of file
+        super(InvalidDatasetType, self).__init__(f"'{input_dataset_type}' is not a valid dataset type!")
+
+
+class NotEnoughUniquePairs(Exception):
+    def __init__(self, pair_type, requested_pairs: int, available_pairs: int):
+        super(NotEnoughUniquePairs, self).__init__(
+            f"Cannot sample {requested_pairs} unique '{pair_type}' pairs, the identifiers allow only {available_pairs}!"
+        )
+
+
+class InvalidPatternDeclaration(Exception):
+    def __init__(self, declaration, reason: str):
+        super(InvalidPatternDeclaration, self).__init__(f"Invalid pattern declaration {declaration}: {reason}")
+
+
+class InvalidCheckpoint(Exception):
+    def __init__(self, checkpoint_path, reason: str):
+        super(InvalidCheckpoint, self).__init__(f"Cannot resume from {checkpoint_path}: {reason}")
+
+
+class InvalidIdentifiersLine(Exception):
+    def __init__(self, file_path, line_number: int, line: str, reason: str):
+        super(InvalidIdentifiersLine, self).__init__(f"{file_path}:{line_number}: {reason}: '{line.strip()}'")
+
+
+class InvalidGenerationRequest(Exception):
+    def __init__(self, reason: str):
+        super(InvalidGenerationRequest, self).__init__(f"Invalid generation request: {reason}")
+
+
+class InvalidFormula(Exception):
+    def __init__(self, formula: str, position: int, reason: str):
+        super(InvalidFormula, self).__init__(f"Invalid formula '{formula}' at character {position}: {reason}")
+
+
+class InvalidPairIndex(Exception):
+    def __init__(self, index_path, reason: str):
+        super(InvalidPairIndex, self).__init__(f"Cannot use the pair index {index_path}: {reason}")
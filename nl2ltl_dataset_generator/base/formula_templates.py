@@ -1,40 +1,62 @@
-from nl2ltl_dataset_generator.base.data_model import PairTerm
+import functools
+import re
 
+from nl2ltl_dataset_generator.base.data_model import PairTerm, FormulaTemplate
 
-def term_formula_template(term: PairTerm) -> str:
-    if term.logical_operator is None:
-        return term.identifiers[0].get_formula_string()
-
-    return f" {term.logical_operator.value} ".join([identifier.get_formula_string() for identifier in term.identifiers])
-
-
-def existence_global_formula_template(term1: PairTerm):
-    return f"F( {term_formula_template(term1)} )"
-
-
-def universal_global_formula_template(term1: PairTerm):
-    return f"G( {term_formula_template(term1)} )"
-
-
-def absence_global_formula_template(term1: PairTerm):
-    return f"G(!( {term_formula_template(term1)} ))"
+# LTL skeleton of each pattern/scope: {2} is the second term of the pair, {name:2,3} the skeleton of name applied to the
+# second and third terms
+formula_templates = {
+    "existence_global": "F( {1} )",
+    "universal_global": "G( {1} )",
+    "absence_global": "G(!( {1} ))",
+    "response_global": "G(( {1} ) -> {existence_global:2})",
+    "existence_after": "{absence_global:1} | F(( {1} ) & {existence_global:2})",
+    "universal_after": "G(( {1} ) -> {universal_global:2})",
+    "absence_after": "G(( {1} ) -> {absence_global:2})",
+    "response_after": "G(( {1} ) -> {response_global:2,3})",
+}
 
+SLOT_PATTERN = re.compile(r"\{([^{}]+)\}")
 
-def response_global_formula_template(term1: PairTerm, term2: PairTerm):
-    return f"G(( {term_formula_template(term1)} ) -> {existence_global_formula_template(term2)})"
 
-
-def existence_after_formula_template(term1: PairTerm, term2: PairTerm):
-    return f"{absence_global_formula_template(term1)} | F(( {term_formula_template(term1)} ) & {existence_global_formula_template(term2)})"
-
-
-def universal_after_formula_template(term1: PairTerm, term2: PairTerm):
-    return f"G(( {term_formula_template(term1)} ) -> {universal_global_formula_template(term2)})"
-
-
-def absence_after_formula_template(term1: PairTerm, term2: PairTerm):
-    return f"G(( {term_formula_template(term1)} ) -> {absence_global_formula_template(term2)})"
-
-
-def response_after_formula_template(term1: PairTerm, term2: PairTerm, term3: PairTerm):
-    return f"G(( {term_formula_template(term1)} ) -> {response_global_formula_template(term2, term3)})"
+def term_formula_template(term: PairTerm) -> str:
+    return term.get_formula_string()
+
+
+@functools.lru_cache(maxsize=None)
+def get_formula_template(name: str) -> FormulaTemplate:
+    """Compile the skeleton of name into a FormulaTemplate, inlining the nested skeletons."""
+    formula_template = FormulaTemplate(name)
+
+    for index, token in enumerate(SLOT_PATTERN.split(formula_templates[name])):
+        if index % 2 == 0:
+            formula_template.append_string(token)
+        elif token.isdigit():
+            formula_template.append_term_by_index(int(token) - 1)
+        else:
+            nested_name, term_numbers = token.split(':')
+            term_indices = [int(term_number) - 1 for term_number in term_numbers.split(',')]
+
+            for part in get_formula_template(nested_name.strip()).parts:
+                if isinstance(part, str):
+                    formula_template.append_string(part)
+                else:
+                    formula_template.append_term_by_index(term_indices[part])
+
+    return formula_template
+
+
+def register_formula_template(name: str, skeleton: str) -> FormulaTemplate:
+    formula_templates[name] = skeleton
+    get_formula_template.cache_clear()
+    return get_formula_template(name)
+
+
+existence_global_formula_template = get_formula_template("existence_global")
+universal_global_formula_template = get_formula_template("universal_global")
+absence_global_formula_template = get_formula_template("absence_global")
+response_global_formula_template = get_formula_template("response_global")
+existence_after_formula_template = get_formula_template("existence_after")
+universal_after_formula_template = get_formula_template("universal_after")
+absence_after_formula_template = get_formula_template("absence_after")
+response_after_formula_template = get_formula_template("response_after")
@@ -1,89 +1,243 @@
+import csv
+import hashlib
+import math
 import string
-from typing import List
+import sys
+from typing import List, Iterable, Generator, Any, Tuple, Optional
 import random
-import itertools
 
 from pathlib import Path
 
-import pandas as pd
-from sklearn.model_selection import train_test_split
-
-from nl2ltl_dataset_generator.base.data_model import UnrestrictedIdentifier, Dataset
+from nl2ltl_dataset_generator.base.data_model import UnrestrictedIdentifier, Dataset, Pair
+from nl2ltl_dataset_generator.base.exceptions import InvalidIdentifiersLine
 from nl2ltl_dataset_generator.base.log import log_time
 
 
-def load_unrestricted_identifiers(file_path: Path) -> List[UnrestrictedIdentifier]:
+IdentifierEntry = Tuple[Tuple[str, ...], str, Tuple[str, ...], Optional[Tuple[str, ...]]]
+
+
+def _parse_verb(raw_verb: str, line_number: int, line: str, file_path: Path) -> Tuple[Tuple[str, ...], Optional[Tuple[str, ...]]]:
+    parts = [part.strip() for part in raw_verb.split('-')]
+
+    if len(parts) > 2:
+        raise InvalidIdentifiersLine(file_path, line_number, line, f"'{raw_verb.strip()}' has more than one '-'")
+    if not all(parts):
+        raise InvalidIdentifiersLine(file_path, line_number, line, "empty verb")
+
+    verb = tuple(parts[-1].split(' '))
+    aux = tuple(parts[0].split(' ')) if len(parts) > 1 else None
+    return verb, aux
+
+
+def iter_identifier_entries(file_path: Path) -> Generator[IdentifierEntry, Any, None]:
+    """Stream the (determiners, noun, verb, aux) entries of an identifiers file, one per verb.
+
+    Each line has the form `determiners; noun; verbs`, e.g. `the-a; cpu; is-overheated, overheats`, where the optional
+    auxiliary of a verb precedes its '-'. Blank lines are skipped, malformed ones raise InvalidIdentifiersLine. The
+    file is read line by line, so its size does not matter. Equal determiners are shared by all the entries.
+    """
     if not file_path.exists():
         raise Exception(f"{file_path} does not exists!")
 
+    determiners_table = {}
+
     with file_path.open('r') as fp:
-        lines = fp.readlines()
+        for line_number, line in enumerate(fp, start=1):
+            if not line.strip():
+                continue
 
-    identifiers = []
+            parts = line.split(';')
+            if len(parts) != 3:
+                raise InvalidIdentifiersLine(
+                    file_path, line_number, line, f"expected 3 ';'-separated fields, found {len(parts)}"
+                )
 
-    for line in lines:
-        parts = line.split(';')
+            determiners = tuple(determiner.strip() for determiner in parts[0].split('-'))
+            determiners = determiners_table.setdefault(determiners, determiners)
 
-        determiners = parts[0].split('-')
+            noun = parts[1].strip()
+            if not noun or len(noun.split()) > 1:
+                raise InvalidIdentifiersLine(file_path, line_number, line, f"'{noun}' is not a single word noun")
+            noun = sys.intern(noun)
 
-        noun = parts[1].strip()
+            if not parts[2].strip():
+                raise InvalidIdentifiersLine(file_path, line_number, line, "no verbs")
 
-        verbs = [verb.strip().split('-') for verb in parts[2].strip().split(',')]
+            for raw_verb in parts[2].split(','):
+                verb, aux = _parse_verb(raw_verb, line_number, line, file_path)
+                yield determiners, noun, verb, aux
 
-        verbs = [(verb[0], verb[1]) if len(verb) > 1 else ('', verb[0]) for verb in verbs]
 
-        identifiers.extend([
-            UnrestrictedIdentifier(determiners, noun, verb.split(' '), aux.split(' ') if aux != '' else None)
-            for noun, (aux, verb) in itertools.product([noun], verbs)
-        ])
+def reservoir_sample(items: Iterable, k: int, rng=random) -> list:
+    """k items sampled uniformly from a stream of unknown length, in their order in the stream."""
+    reservoir = []
 
-    return identifiers
+    for index, item in enumerate(items):
+        if index < k:
+            reservoir.append((index, item))
+        elif (position := rng.randrange(index + 1)) < k:
+            reservoir[position] = (index, item)
+
+    return [item for _, item in sorted(reservoir, key=lambda indexed_item: indexed_item[0])]
+
+
+@log_time
+def load_unrestricted_identifiers(file_path: Path, sample_size: int = None, rng=random) -> List[UnrestrictedIdentifier]:
+    """Load the identifiers of file_path, or a uniform sample of sample_size of them, see iter_identifier_entries."""
+    entries = iter_identifier_entries(file_path)
+
+    if sample_size is not None:
+        entries = reservoir_sample(entries, sample_size, rng)
+
+    return [UnrestrictedIdentifier(determiners, noun, verb, aux) for determiners, noun, verb, aux in entries]
+
+
+CSV_COLUMNS = ["pair_type", "ltl", "en"]
+
+
+def pair_to_row(pair: Pair) -> List[str]:
+    return [str(pair.pair_type), pair.formula, pair.phrase]
 
 
 @log_time
 def save_csv(dataset: Dataset, file_path: Path) -> None:
-    df = pd.DataFrame(
-        [[f"{pair.pair_type.pattern}_{pair.pair_type.scope}", pair.formula, pair.phrase] for pair in dataset.pairs],
-        columns=["pair_type", "ltl", "en"]
-    )
+    with file_path.open('w', newline='') as fp:
+        writer = csv.writer(fp, lineterminator='\n')
+        writer.writerow(CSV_COLUMNS)
+        writer.writerows(pair_to_row(pair) for pair in dataset.pairs)
+
+
+@log_time
+def save_csv_stream(chunks: Iterable[List[Pair]], file_path: Path, append: bool = False) -> int:
+    """Write chunks of rendered pairs as soon as they are produced, returns the number of written rows.
+
+    The output is the same that save_csv writes for the same pairs. With append, the rows are added to the end of an
+    existing file, which already has the header.
+    """
+    n_rows = 0
 
-    df.to_csv(file_path, index=False)
+    with file_path.open('a' if append else 'w', newline='') as fp:
+        writer = csv.writer(fp, lineterminator='\n')
+        if not append:
+            writer.writerow(CSV_COLUMNS)
 
+        for chunk in chunks:
+            writer.writerows(pair_to_row(pair) for pair in chunk)
+            fp.flush()
+            n_rows += len(chunk)
 
+    return n_rows
+
+
+SPLITS = ("train", "val", "test")
+
+
+def assign_split(pair: Pair, test_size: float, val_size: float = None, seed: int = 0) -> str:
+    """Assign a rendered pair to a split by hashing its formula, so that a formula never appears in two splits.
+
+    The expected fraction of pairs in test is test_size, and in val val_size of the remaining ones.
+    """
+    digest = hashlib.blake2b(f"{seed}:{pair.formula}".encode(), digest_size=8).digest()
+    position = int.from_bytes(digest, "little") / 2 ** 64
+
+    if position < test_size:
+        return "test"
+
+    if val_size is not None and position < test_size + val_size * (1 - test_size):
+        return "val"
+
+    return "train"
+
+
+class DatasetSplitter:
+    """Writes rendered pairs to train/val/test files in OpenNMT format (src-*.txt, tgt-*.txt) as they stream out.
+
+    Each pair is assigned with assign_split, with csv also to train.csv, val.csv and test.csv. With append, the
+    pairs are added to the files of a previous run.
+    """
+    BUFFER_SIZE = 2 ** 20
+
+    def __init__(self, directory_path: Path, test_size: float = .33, val_size: float = None, seed: int = 0,
+                 csv_files: bool = False, append: bool = False):
+        self.directory_path = directory_path
+        self.test_size = test_size
+        self.val_size = val_size
+        self.seed = seed
+        self.csv_files = csv_files
+        self.append = append
+        self.splits = [split for split in SPLITS if split != "val" or val_size is not None]
+        self.counts = {split: 0 for split in self.splits}
+        self._files = []
+        self._src_files = {}
+        self._tgt_files = {}
+        self._csv_writers = {}
+
+    def _open(self, file_name: str):
+        fp = (self.directory_path / file_name).open('a' if self.append else 'w', newline='', buffering=self.BUFFER_SIZE)
+        self._files.append(fp)
+        return fp
+
+    def __enter__(self) -> "DatasetSplitter":
+        self.directory_path.mkdir(parents=True, exist_ok=True)
+
+        for split in self.splits:
+            self._src_files[split] = self._open(f"src-{split}.txt")
+            self._tgt_files[split] = self._open(f"tgt-{split}.txt")
+            if self.csv_files:
+                self._csv_writers[split] = csv.writer(self._open(f"{split}.csv"), lineterminator='\n')
+                if not self.append:
+                    self._csv_writers[split].writerow(CSV_COLUMNS)
+
+        return self
+
+    def __exit__(self, *exc_info):
+        for fp in self._files:
+            fp.close()
+        self._files = []
+
+    def write(self, pairs: Iterable[Pair]) -> None:
+        for pair in pairs:
+            split = assign_split(pair, self.test_size, self.val_size, self.seed)
+            self._src_files[split].write(f"{pair.phrase}\n")
+            self._tgt_files[split].write(f"{pair.formula}\n")
+            if self.csv_files:
+                self._csv_writers[split].writerow(pair_to_row(pair))
+            self.counts[split] += 1
+
+    def tee(self, chunks: Iterable[List[Pair]]) -> Generator[List[Pair], Any, None]:
+        """Write each chunk and pass it on, e.g. to save_csv_stream."""
+        for chunk in chunks:
+            self.write(chunk)
+            yield chunk
+
+
+@log_time
 def save_opennmt_format(dataset: Dataset,
                         directory_path: Path,
                         test_size: float = .33,
                         val_size: float = None,
                         shuffle: bool = True) -> None:
-    SRC_TRAIN = directory_path / "src-train.txt"
-    SRC_VAL = directory_path / "src-val.txt"
-    SRC_TEST = directory_path / "src-test.txt"
+    """Write the pairs to train/val/test files in OpenNMT format, splitting them in contiguous slices.
 
-    TGT_TRAIN = directory_path / "tgt-train.txt"
-    TGT_VAL = directory_path / "tgt-val.txt"
-    TGT_TEST = directory_path / "tgt-test.txt"
+    test is the last ceil(test_size * n) pairs, val the last ceil(val_size * m) of the m remaining ones.
+    """
+    pairs = list(dataset.pairs)
 
     if shuffle:
-        random.shuffle(dataset.pairs)
+        random.shuffle(pairs)
 
-    df = pd.DataFrame(
-        [[pair.formula, pair.phrase] for pair in dataset.pairs],
-        columns=["ltl_formula", "phrase"]
-    )
+    train_pairs, test_pairs = _split_tail(pairs, test_size)
+    train_pairs, val_pairs = _split_tail(train_pairs, val_size) if val_size is not None else (train_pairs, None)
 
-    X_train, X_test, Y_train, Y_test = train_test_split(df["phrase"], df["ltl_formula"], test_size=test_size,
-                                                        shuffle=False)
+    for split, split_pairs in zip(SPLITS, (train_pairs, val_pairs, test_pairs)):
+        if split_pairs is None:
+            continue
 
-    X_train, X_val, Y_train, Y_val = (
-        train_test_split(X_train, Y_train, test_size=val_size, shuffle=False)
-        if val_size is not None
-        else (X_train, None, Y_train, None)
-    )
+        with (directory_path / f"src-{split}.txt").open('w') as src_fp, (directory_path / f"tgt-{split}.txt").open('w') as tgt_fp:
+            src_fp.writelines(f"{pair.phrase}\n" for pair in split_pairs)
+            tgt_fp.writelines(f"{pair.formula}\n" for pair in split_pairs)
 
-    pd.DataFrame(X_train).to_csv(SRC_TRAIN, sep='\n', index=False, header=False)
-    pd.DataFrame(X_val).to_csv(SRC_VAL, sep='\n', index=False, header=False) if X_val is not None else None
-    pd.DataFrame(X_test).to_csv(SRC_TEST, sep='\n', index=False, header=False)
 
-    pd.DataFrame(Y_train).to_csv(TGT_TRAIN, sep='\n', index=False, header=False)
-    pd.DataFrame(Y_val).to_csv(TGT_VAL, sep='\n', index=False, header=False) if Y_val is not None else None
-    pd.DataFrame(Y_test).to_csv(TGT_TEST, sep='\n', index=False, header=False)
+def _split_tail(pairs: List[Pair], size: float) -> Tuple[List[Pair], List[Pair]]:
+    n_tail = math.ceil(size * len(pairs))
+    return pairs[:len(pairs) - n_tail], pairs[len(pairs) - n_tail:]
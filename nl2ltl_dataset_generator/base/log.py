@@ -1,27 +1,147 @@
+import bisect
 import functools
+import json
 import time
+from typing import Dict, Iterable
 
-import numpy
+PIPELINE_SCOPE = "pipeline"
+SAMPLING_SCOPE = "sampling"
+RENDERING_SCOPE = "rendering"
 
-means = {}
+# upper bounds, in seconds, of the histogram buckets
+HISTOGRAM_BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1, 1.0, 10.0, 100.0)
 
 
-def log_time(func):
+class Metric:
+    """Aggregated observations of a value: count, total, min, max and a fixed-bucket histogram."""
+    __slots__ = ("name", "scope", "count", "total", "min", "max", "buckets")
+
+    def __init__(self, name: str, scope: str):
+        self.name = name
+        self.scope = scope
+        self.count = 0
+        self.total = 0.
+        self.min = float("inf")
+        self.max = float("-inf")
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+        self.buckets[bisect.bisect_left(HISTOGRAM_BUCKETS, value)] += 1
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.
+
+    def to_dict(self) -> dict:
+        return {
+            "scope": self.scope,
+            "count": self.count,
+            "total": self.total,
+            "mean": self.mean,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "buckets": dict(zip([*map(str, HISTOGRAM_BUCKETS), "+Inf"], self.buckets)),
+        }
+
+
+class MetricsScope:
+    __slots__ = ("name", "enabled")
+
+    def __init__(self, name: str, enabled: bool = False):
+        self.name = name
+        self.enabled = enabled
+
+
+class MetricsRegistry:
+    """Collects metrics grouped in scopes, that can be enabled and disabled independently."""
+    def __init__(self, enabled_scopes: Iterable[str] = (PIPELINE_SCOPE,)):
+        self.scopes: Dict[str, MetricsScope] = {}
+        self.metrics: Dict[str, Metric] = {}
+
+        for scope in enabled_scopes:
+            self.get_scope(scope).enabled = True
+
+    def get_scope(self, name: str) -> MetricsScope:
+        if name not in self.scopes:
+            self.scopes[name] = MetricsScope(name)
+        return self.scopes[name]
+
+    def enable(self, *scopes: str) -> None:
+        for scope in scopes:
+            self.get_scope(scope).enabled = True
+
+    def disable(self, *scopes: str) -> None:
+        for scope in scopes:
+            self.get_scope(scope).enabled = False
+
+    def observe(self, name: str, value: float, scope: str = PIPELINE_SCOPE) -> None:
+        if (metric := self.metrics.get(name)) is None:
+            metric = self.metrics[name] = Metric(name, scope)
+        metric.observe(value)
+
+    def reset(self) -> None:
+        self.metrics.clear()
+
+    def to_dict(self) -> dict:
+        return {name: metric.to_dict() for name, metric in self.metrics.items()}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    def to_prometheus(self, metric_name: str = "nl2ltl_function_seconds") -> str:
+        lines = [f"# TYPE {metric_name} histogram"]
+
+        for metric in self.metrics.values():
+            labels = f'function="{metric.name}",scope="{metric.scope}"'
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip([*map(str, HISTOGRAM_BUCKETS), "+Inf"], metric.buckets):
+                cumulative_count += bucket_count
+                lines.append(f'{metric_name}_bucket{{{labels},le="{upper_bound}"}} {cumulative_count}')
+            lines.append(f"{metric_name}_sum{{{labels}}} {metric.total}")
+            lines.append(f"{metric_name}_count{{{labels}}} {metric.count}")
+
+        for aggregate in ("min", "max"):
+            lines.append(f"# TYPE {metric_name}_{aggregate} gauge")
+            lines.extend(
+                f'{metric_name}_{aggregate}{{function="{metric.name}",scope="{metric.scope}"}} {getattr(metric, aggregate)}'
+                for metric in self.metrics.values() if metric.count
+            )
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def log_time(func=None, *, scope: str = PIPELINE_SCOPE):
+    """Record the run time of func in the registry, as long as its scope is enabled.
+
+    When the scope is disabled the only overhead is a flag check.
+    """
+    if func is None:
+        return functools.partial(log_time, scope=scope)
+
+    metrics_scope = registry.get_scope(scope)
+    name = getattr(func, "__qualname__", None) or getattr(func, "name", repr(func))
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        start_time = time.perf_counter()  # 1
+        if not metrics_scope.enabled:
+            return func(*args, **kwargs)
+
+        start_time = time.perf_counter()
         value = func(*args, **kwargs)
-        end_time = time.perf_counter()  # 2
-        run_time = end_time - start_time  # 3
-        # print(f"Finished {func.__name__!r} in {run_time:.4f} secs")
-        if (func_name := func.__name__) in means:
-            means[func_name].append(run_time)
-        else:
-            means[func_name] = [run_time]
+        registry.observe(name, time.perf_counter() - start_time, scope)
         return value
 
     return wrapper
 
 
 def get_means():
-    return {k: numpy.mean(v) for k, v in means.items()}
+    return {name: metric.mean for name, metric in registry.metrics.items()}
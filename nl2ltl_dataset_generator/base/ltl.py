@@ -0,0 +1,180 @@
+import functools
+import hashlib
+import re
+from typing import Union, List, Generator, Any, NamedTuple, Dict
+
+from nl2ltl_dataset_generator.base.data_model import Pair, Dataset
+from nl2ltl_dataset_generator.base.exceptions import InvalidFormula
+from nl2ltl_dataset_generator.base.log import log_time
+
+# A formula is an atomic proposition, a string, or a tuple whose first item is its operator: (UNARY, child),
+# (BINARY, left, right) or (N-ARY, *children). Tuples are hashable and cheap to build and compare.
+Formula = Union[str, tuple]
+
+UNARY_OPERATORS = ("!", "G", "F", "X")
+# precedence of the binary operators, from the loosest: & and | are n-ary, the others right associative
+BINARY_OPERATORS = {"<->": 0, "->": 0, "|": 1, "&": 2, "U": 3, "W": 3, "R": 3}
+NARY_OPERATORS = ("&", "|")
+COMMUTATIVE_OPERATORS = ("&", "|", "<->")
+
+# operators, parentheses and atomic propositions, anything else not blank is an invalid character
+TOKEN_PATTERN = re.compile(r"(<->|->|[!&|()]|[A-Za-z_][A-Za-z0-9_]*)|(\S)")
+# the names of the temporal operators are reserved, any other word is an atomic proposition
+KEYWORDS = frozenset(("G", "F", "X", "U", "W", "R"))
+CANONICAL_CACHE_SIZE = 2 ** 16
+
+
+def tokenize(formula: str) -> List[str]:
+    tokens = TOKEN_PATTERN.findall(formula)
+
+    for token, invalid_character in tokens:
+        if invalid_character:
+            position = next(match.start() for match in TOKEN_PATTERN.finditer(formula) if match.group(2))
+            raise InvalidFormula(formula, position, f"unexpected '{invalid_character}'")
+
+    return [token for token, _ in tokens]
+
+
+class _Parser:
+    """Precedence climbing parser, see BINARY_OPERATORS, whose unary operators bind tighter than the binary ones."""
+    def __init__(self, formula: str):
+        self.formula = formula
+        self.tokens = tokenize(formula)
+        self.tokens.append(None)
+        self.position = 0
+
+    def _error(self, reason: str) -> InvalidFormula:
+        # the position of the current token in the formula
+        matches = [match for match in TOKEN_PATTERN.finditer(self.formula)]
+        position = matches[self.position].start() if self.position < len(matches) else len(self.formula)
+        return InvalidFormula(self.formula, position, reason)
+
+    def parse(self) -> Formula:
+        formula = self._parse_binary(0)
+        if self.tokens[self.position] is not None:
+            raise self._error(f"unexpected '{self.tokens[self.position]}'")
+        return formula
+
+    def _parse_binary(self, min_precedence: int) -> Formula:
+        left = self._parse_unary()
+
+        while (operator := self.tokens[self.position]) in BINARY_OPERATORS:
+            precedence = BINARY_OPERATORS[operator]
+            if precedence < min_precedence:
+                break
+            self.position += 1
+
+            if operator not in NARY_OPERATORS:
+                # right associative
+                left = operator, left, self._parse_binary(precedence)
+                continue
+
+            operands = [left, self._parse_binary(precedence + 1)]
+            while self.tokens[self.position] == operator:
+                self.position += 1
+                operands.append(self._parse_binary(precedence + 1))
+            left = operator, *operands
+
+        return left
+
+    def _parse_unary(self) -> Formula:
+        token = self.tokens[self.position]
+        if token is None:
+            raise self._error("unexpected end of the formula")
+        self.position += 1
+
+        if token in UNARY_OPERATORS:
+            return token, self._parse_unary()
+
+        if token == "(":
+            formula = self._parse_binary(0)
+            if self.tokens[self.position] != ")":
+                raise self._error("expected ')'" if self.tokens[self.position] is None
+                                  else f"unexpected '{self.tokens[self.position]}'")
+            self.position += 1
+            return formula
+
+        if token in KEYWORDS or not (token[0].isalpha() or token[0] == "_"):
+            self.position -= 1
+            raise self._error(f"unexpected '{token}'")
+
+        return token
+
+
+def parse_formula(formula: str) -> Formula:
+    """Parse an LTL formula written as in formula_templates.py, raises InvalidFormula if it is malformed."""
+    return _Parser(formula).parse()
+
+
+class _Canonical(NamedTuple):
+    operator: str
+    # canonical operands of & and |, by their text
+    operands: Dict[str, '_Canonical']
+    text: str
+
+    @property
+    def operand_text(self) -> str:
+        """The text as the operand of a binary operator."""
+        return self.text if self.operator is None or self.operator in UNARY_OPERATORS else f"({self.text})"
+
+
+def _canonical(formula: Formula) -> _Canonical:
+    """Flatten nested &/|, drop their repeated operands and sort the operands of the commutative operators, building
+    the text bottom up. Temporal operators are always followed by a parenthesis, as Fa would be an atomic proposition."""
+    if isinstance(formula, str):
+        return _Canonical(None, None, formula)
+
+    operator, *operands = formula
+    operands = [_canonical(operand) for operand in operands]
+
+    if len(operands) == 1:
+        operand = operands[0]
+        if operator == "!" and (operand.operator is None or operand.operator in UNARY_OPERATORS):
+            return _Canonical(operator, None, f"!{operand.text}")
+        return _Canonical(operator, None, f"{operator}({operand.text})")
+
+    if operator in NARY_OPERATORS:
+        flat_operands = {}
+        for operand in operands:
+            flat_operands.update(operand.operands if operand.operator == operator else {operand.text: operand})
+        if len(flat_operands) == 1:
+            return next(iter(flat_operands.values()))
+        operands = [flat_operands[text] for text in sorted(flat_operands)]
+        return _Canonical(operator, flat_operands, f" {operator} ".join(operand.operand_text for operand in operands))
+
+    if operator in COMMUTATIVE_OPERATORS:
+        operands.sort(key=lambda canonical_operand: canonical_operand.text)
+
+    return _Canonical(operator, None, f" {operator} ".join(operand.operand_text for operand in operands))
+
+
+@functools.lru_cache(maxsize=CANONICAL_CACHE_SIZE)
+def canonicalize(formula: str) -> str:
+    """The canonical text of a formula: formulas equal up to spacing, parentheses and the order or repetition of the
+    operands of &, | and <-> have the same one. The last canonical texts are cached, e.g. for validation followed by
+    deduplication."""
+    return _canonical(parse_formula(formula)).text
+
+
+def hash_formula(pair: Pair) -> int:
+    """64-bit digest of the canonical formula of a rendered pair, equal for equivalent formulas."""
+    digest = hashlib.blake2b(canonicalize(pair.formula).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class ValidatedDatasetGenerator:
+    """Parses the formula of every generated row, raising InvalidFormula at the first malformed one."""
+    def __init__(self, dataset_generator):
+        self.dataset_generator = dataset_generator
+        self.dataset_distribution = dataset_generator.dataset_distribution
+        self.dataset_type = dataset_generator.dataset_type
+
+    def generate_chunks(self) -> Generator[List[Pair], Any, None]:
+        for chunk in self.dataset_generator.generate_chunks():
+            for pair in chunk:
+                canonicalize(pair.formula)
+            yield chunk
+
+    @log_time
+    def generate_dataset(self) -> Dataset:
+        return Dataset([pair for chunk in self.generate_chunks() for pair in chunk], self.dataset_type)
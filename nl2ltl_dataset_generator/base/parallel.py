@@ -0,0 +1,90 @@
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Generator, Any
+
+from nl2ltl_dataset_generator.base.core import PairGenerationStrategy, iter_strings
+from nl2ltl_dataset_generator.base.data_model import DatasetDistribution, DatasetType, Pair, Shard, Dataset
+from nl2ltl_dataset_generator.base.log import log_time
+from nl2ltl_dataset_generator.base.profiling import profiler, SAMPLING_STAGE, RENDERING_STAGE, WORKERS_STAGE
+
+DEFAULT_SHARD_SIZE = 10000
+
+_worker_generation_strategy: PairGenerationStrategy = None
+
+
+def _initialize_worker(generation_strategy: PairGenerationStrategy) -> None:
+    global _worker_generation_strategy
+    _worker_generation_strategy = generation_strategy
+    profiler.disable()
+
+
+@log_time
+def generate_shard(generation_strategy: PairGenerationStrategy, shard: Shard) -> List[Pair]:
+    """Generate and render the pairs of a Shard, using only the random stream of the shard."""
+    rng = random.Random(shard.seed)
+
+    with profiler.stage(SAMPLING_STAGE):
+        pairs = generation_strategy.get_shard_pairs(shard, rng)
+        # sampled before the rendering, only to profile them apart
+        if profiler.enabled:
+            pairs = list(pairs)
+
+    with profiler.stage(RENDERING_STAGE):
+        if generation_strategy.batch_rendering:
+            from nl2ltl_dataset_generator.base.batch import get_batch_renderer
+            return get_batch_renderer(rng).render(pairs)
+
+        return list(iter_strings(pairs, rng))
+
+
+def _generate_shard_in_worker(shard: Shard) -> List[Pair]:
+    return generate_shard(_worker_generation_strategy, shard)
+
+
+class ShardedDatasetGenerator:
+    """Generates a Dataset split in shards, optionally on a pool of processes.
+
+    For a given seed and shard size the dataset is the same whatever the number of workers.
+    """
+    def __init__(self, dataset_distribution: DatasetDistribution, dataset_type: DatasetType,
+                 generation_strategy: PairGenerationStrategy, seed: int, workers: int = 1,
+                 shard_size: int = DEFAULT_SHARD_SIZE):
+        self.dataset_distribution = dataset_distribution
+        self.dataset_type = dataset_type
+        self.generation_strategy = generation_strategy
+        self.seed = seed
+        self.workers = workers
+        self.shard_size = shard_size
+
+    def get_shards(self) -> List[Shard]:
+        return self.dataset_distribution.get_shards(self.seed, self.shard_size)
+
+    def generate_chunks(self, shards: List[Shard] = None) -> Generator[List[Pair], Any, None]:
+        """Generate the rendered pairs shard by shard, in order, one chunk per shard of get_shards or of shards."""
+        shards = shards if shards is not None else self.get_shards()
+
+        if self.workers <= 1:
+            for shard in shards:
+                yield generate_shard(self.generation_strategy, shard)
+            return
+
+        with ProcessPoolExecutor(self.workers, initializer=_initialize_worker,
+                                 initargs=(self.generation_strategy,)) as executor:
+            # keep a bounded number of shards in flight, so that memory does not grow when the consumer is slower
+            pending = deque()
+            for shard in shards:
+                pending.append(executor.submit(_generate_shard_in_worker, self.generation_strategy.prepare_shard(shard)))
+                if len(pending) >= 2 * self.workers:
+                    with profiler.stage(WORKERS_STAGE):
+                        chunk = pending.popleft().result()
+                    yield chunk
+
+            while pending:
+                with profiler.stage(WORKERS_STAGE):
+                    chunk = pending.popleft().result()
+                yield chunk
+
+    @log_time
+    def generate_dataset(self) -> Dataset:
+        return Dataset([pair for chunk in self.generate_chunks() for pair in chunk], self.dataset_type)
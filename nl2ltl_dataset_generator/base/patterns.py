@@ -0,0 +1,142 @@
+import json
+import re
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Dict
+
+from nl2ltl_dataset_generator.base.data_model import Pattern, Scope, PairType, PairTypeDistribution, PairTerm, \
+    RestrictedIdentifier, LogicalOperator, RESTRICTED_DETERMINERS
+from nl2ltl_dataset_generator.base.exceptions import InvalidPatternDeclaration, InvalidFormula
+from nl2ltl_dataset_generator.base.formula_templates import formula_templates, get_formula_template, \
+    register_formula_template
+from nl2ltl_dataset_generator.base.ltl import parse_formula
+from nl2ltl_dataset_generator.base.phrase_templates import phrase_templates, get_phrase_template, \
+    register_phrase_templates
+
+MAX_TERMS = 3
+NAME_PATTERN = re.compile(r"[a-z][a-z0-9_]*")
+
+
+@dataclass
+class PatternDeclaration:
+    """A pattern/scope to generate, with its weight in the dataset distribution.
+
+    Patterns and scopes are names, those of Pattern and Scope being the ones with built-in templates. The templates
+    are needed only for patterns that are not already registered, see formula_templates.py and phrase_templates.py
+    for their syntax.
+    """
+    pattern: str
+    scope: str
+    n_terms: int
+    weight: int
+    formula_template: str = None
+    phrase_templates: List[str] = None
+    phrase_template_slots: Dict[str, list] = None
+
+    def __post_init__(self):
+        # Pattern and Scope members are accepted by their names
+        self.pattern = str(self.pattern)
+        self.scope = str(self.scope)
+
+    @property
+    def name(self) -> str:
+        return f"{self.pattern}_{self.scope}"
+
+
+default_pattern_declarations = [
+    PatternDeclaration(Pattern.ABSENCE, Scope.GLOBAL, 1, 4),
+    PatternDeclaration(Pattern.UNIVERSAL, Scope.GLOBAL, 1, 14),
+    PatternDeclaration(Pattern.EXISTENCE, Scope.GLOBAL, 1, 5),
+    PatternDeclaration(Pattern.RESPONSE, Scope.GLOBAL, 2, 23),
+    PatternDeclaration(Pattern.ABSENCE, Scope.AFTER, 2, 1),
+    PatternDeclaration(Pattern.UNIVERSAL, Scope.AFTER, 2, 1),
+    PatternDeclaration(Pattern.EXISTENCE, Scope.AFTER, 2, 4),
+    PatternDeclaration(Pattern.RESPONSE, Scope.AFTER, 3, 3),
+]
+
+
+def register_pattern(declaration: PatternDeclaration) -> None:
+    """Register the templates of the declaration, if any, and check that the pattern can be generated."""
+    if not 1 <= declaration.n_terms <= MAX_TERMS:
+        raise InvalidPatternDeclaration(declaration, f"the number of terms must be between 1 and {MAX_TERMS}")
+
+    if declaration.formula_template is not None:
+        register_formula_template(declaration.name, declaration.formula_template)
+
+    if declaration.phrase_templates is not None:
+        if declaration.phrase_template_slots is None:
+            raise InvalidPatternDeclaration(declaration, "phrase templates need their phrase template slots")
+        register_phrase_templates(declaration.name, declaration.phrase_templates, declaration.phrase_template_slots)
+
+    if declaration.name not in formula_templates or declaration.name not in phrase_templates:
+        raise InvalidPatternDeclaration(declaration, f"no templates are registered for '{declaration.name}'")
+
+    for template in (get_formula_template(declaration.name), get_phrase_template(declaration.name)):
+        if template.n_terms != declaration.n_terms:
+            raise InvalidPatternDeclaration(
+                declaration, f"the templates of '{declaration.name}' use {template.n_terms} terms, not {declaration.n_terms}"
+            )
+
+    # the formulas only differ in their terms, so a formula with placeholder terms validates all of them
+    placeholder_terms = [
+        PairTerm([RestrictedIdentifier(RESTRICTED_DETERMINERS, f"term_{index}_{position}") for position in range(2)],
+                 LogicalOperator.OR)
+        for index in range(declaration.n_terms)
+    ]
+    try:
+        parse_formula(get_formula_template(declaration.name)(*placeholder_terms))
+    except InvalidFormula as error:
+        raise InvalidPatternDeclaration(declaration, str(error)) from None
+
+
+def _parse_name(value, declaration: dict) -> str:
+    if not isinstance(value, str) or not NAME_PATTERN.fullmatch(value.lower()):
+        raise InvalidPatternDeclaration(
+            declaration, f"'{value}' is not a valid name, use letters, digits and underscores"
+        )
+    return value.lower()
+
+
+def load_pattern_declarations(file_path: Path) -> List[PatternDeclaration]:
+    """Load a JSON list of pattern declarations, e.g.
+
+    [{"pattern": "precedence", "scope": "global", "n_terms": 2, "weight": 3, "formula_template": "...",
+      "phrase_templates": ["only after Term1, Term2"], "phrase_template_slots": {"Term1": ["term", 0], ...}}]
+    """
+    if not file_path.exists():
+        raise Exception(f"{file_path} does not exists!")
+
+    with file_path.open('r') as fp:
+        raw_declarations = json.load(fp)
+
+    declarations = []
+
+    for raw_declaration in raw_declarations:
+        try:
+            declarations.append(PatternDeclaration(
+                _parse_name(raw_declaration["pattern"], raw_declaration),
+                _parse_name(raw_declaration["scope"], raw_declaration),
+                int(raw_declaration["n_terms"]),
+                int(raw_declaration["weight"]),
+                raw_declaration.get("formula_template"),
+                raw_declaration.get("phrase_templates"),
+                raw_declaration.get("phrase_template_slots"),
+            ))
+        except KeyError as error:
+            raise InvalidPatternDeclaration(raw_declaration, f"missing {error}") from None
+
+    return declarations
+
+
+def build_pair_types(declarations: List[PatternDeclaration]) -> List[PairType]:
+    pair_types = []
+
+    for declaration in declarations:
+        register_pattern(declaration)
+        pair_types.append(PairType(
+            declaration.pattern, declaration.scope, declaration.n_terms,
+            get_phrase_template(declaration.name), get_formula_template(declaration.name),
+            PairTypeDistribution(declaration.weight)
+        ))
+
+    return pair_types
@@ -1,7 +1,9 @@
+import functools
 import random
-from typing import List
+import re
+from typing import List, Tuple, Union, Iterable
 
-from nl2ltl_dataset_generator.base.data_model import PairTerm, Identifier, LogicalOperator
+from nl2ltl_dataset_generator.base.data_model import PairTerm, LogicalOperator
 
 phrase_templates = {
     "absence_global": [
@@ -75,137 +77,164 @@ phrase_templates = {
 }
 
 
-def or_logical_operator_phrase_template(identifier1: Identifier, identifier2: Identifier,
-                                        identifier3: Identifier = None) -> str:
-    two_terms = [
-        f"either {identifier1.get_phrase_string()} or {identifier2.get_phrase_string()}",
-        f"{identifier1.get_phrase_string()} or {identifier2.get_phrase_string()}",
-    ]
-    three_terms = [
-        f"either {identifier1.get_phrase_string()}, {identifier2.get_phrase_string()} or {identifier3.get_phrase_string()}",
-        f"{identifier1.get_phrase_string()} or {identifier2.get_phrase_string()} or {identifier3.get_phrase_string()}",
-    ] if identifier3 is not None else []
-
-    return random.choice(two_terms) if identifier3 is None else random.choice(three_terms)
-
-
-def and_logical_operator_phrase_template(identifier1: Identifier, identifier2: Identifier,
-                                         identifier3: Identifier = None) -> str:
-    two_terms = [
-        f"both {identifier1.get_phrase_string()} and {identifier2.get_phrase_string()}",
-        f"{identifier1.get_phrase_string()} and {identifier2.get_phrase_string()}",
-    ]
-    three_terms = [
-        f"{identifier1.get_phrase_string()}, {identifier2.get_phrase_string()} and {identifier3.get_phrase_string()}",
-        f"{identifier1.get_phrase_string()} and together {identifier2.get_phrase_string()} and {identifier3.get_phrase_string()}",
-        f"{identifier1.get_phrase_string()} and, at the same time, {identifier2.get_phrase_string()} and {identifier3.get_phrase_string()}",
-    ] if identifier3 is not None else []
-
-    return random.choice(two_terms) if identifier3 is None else random.choice(three_terms)
-
-
-def term_phrase_template(term: PairTerm) -> str:
-    if term.logical_operator is None:
-        return term.identifiers[0].get_phrase_string()
-
-    if term.logical_operator == LogicalOperator.OR:
-        return or_logical_operator_phrase_template(*term.identifiers)
-    elif term.logical_operator == LogicalOperator.AND:
-        return and_logical_operator_phrase_template(*term.identifiers)
-
-
-def absence_global_phrase_template(terms: List[PairTerm]):
-    accepted_terms = 1
-    if len(terms) != accepted_terms:
-        raise Exception(f"Too many terms for 'absence_global' formula, got {len(terms)} expected {accepted_terms}")
-
-    templates = phrase_templates["absence_global"]
-
-    template = random.sample(templates, 1)[0]
-
-    return template.replace("Term1", term_phrase_template(terms[0]))
-
+# how the slots of each template are filled: with the phrase of one of its terms, or with another template applied to
+# some of its terms
+phrase_template_slots = {
+    "absence_global": {"Term1": ("term", 0)},
+    "existence_global": {"Term1": ("term", 0)},
+    "universal_global": {"Term1": ("term", 0)},
+    "response_global": {"Term1": ("term", 0), "Term2": ("existence_global", 1)},
+    "absence_after": {"Term1": ("term", 0), "Term2": ("absence_global", 1)},
+    "existence_after": {"Term1": ("existence_global", 0), "Term2": ("existence_global", 1)},
+    "universal_after": {"Term1": ("term", 0), "Term2": ("universal_global", 1)},
+    "response_after": {"Term1": ("term", 0), "Term2": ("response_global", 1, 2)},
+}
 
-def existence_global_phrase_template(terms: List[PairTerm]):
-    accepted_terms = 1
-    if len(terms) != accepted_terms:
-        raise Exception(f"Too many terms for 'absence_global' formula, got {len(terms)} expected {accepted_terms}")
+logical_operator_phrase_templates = {
+    LogicalOperator.OR: {
+        2: [
+            "either Identifier1 or Identifier2",
+            "Identifier1 or Identifier2",
+        ],
+        3: [
+            "either Identifier1, Identifier2 or Identifier3",
+            "Identifier1 or Identifier2 or Identifier3",
+        ],
+    },
+    LogicalOperator.AND: {
+        2: [
+            "both Identifier1 and Identifier2",
+            "Identifier1 and Identifier2",
+        ],
+        3: [
+            "Identifier1, Identifier2 and Identifier3",
+            "Identifier1 and together Identifier2 and Identifier3",
+            "Identifier1 and, at the same time, Identifier2 and Identifier3",
+        ],
+    },
+}
 
-    templates = phrase_templates["existence_global"]
+SLOT_PATTERN = re.compile(r"((?:Term|Identifier)\d)")
 
-    template = random.sample(templates, 1)[0]
 
-    return template.replace("Term1", term_phrase_template(terms[0]))
+def _merge_literals(parts: Iterable[Union[str, int]]) -> Tuple[Union[str, int], ...]:
+    merged = []
+    for part in parts:
+        if merged and isinstance(part, str) and isinstance(merged[-1], str):
+            merged[-1] += part
+        elif part != "":
+            merged.append(part)
+    return tuple(merged)
 
 
-def universal_global_phrase_template(terms: List[PairTerm]):
-    accepted_terms = 1
-    if len(terms) != accepted_terms:
-        raise Exception(f"Too many terms for 'absence_global' formula, got {len(terms)} expected {accepted_terms}")
+def compile_template(template: str) -> Tuple[Union[str, int], ...]:
+    """Split a template in literal segments and 0-based slot indices, e.g. "if Term1 then Term2" -> ("if ", 0, " then ", 1)."""
+    return _merge_literals(
+        int(token[-1]) - 1 if SLOT_PATTERN.fullmatch(token) else token
+        for token in SLOT_PATTERN.split(template)
+    )
 
-    templates = phrase_templates["universal_global"]
 
-    template = random.sample(templates, 1)[0]
+@functools.lru_cache(maxsize=None)
+def _compile_alternatives(name: str) -> Tuple[Tuple[Union[str, int], ...], ...]:
+    """Compile the templates of name, inlining the nested templates, into alternatives of literals and term indices.
 
-    return template.replace("Term1", term_phrase_template(terms[0]))
+    An alternative with a nested template expands to one alternative for each of the nested ones: as long as every
+    alternative expands to the same number of alternatives, a uniform choice among them is the same as the uniform
+    choices of the original templates.
+    """
+    slots = phrase_template_slots[name]
+    alternatives = []
+    n_expansions = set()
 
+    for template in phrase_templates[name]:
+        expansions = [()]
 
-def response_global_phrase_template(terms: List[PairTerm]):
-    accepted_terms = 2
-    if len(terms) != accepted_terms:
-        raise Exception(f"Too many terms for 'absence_global' formula, got {len(terms)} expected {accepted_terms}")
+        for part in compile_template(template):
+            if isinstance(part, str):
+                options = [(part,)]
+            else:
+                filler, *term_indices = slots[f"Term{part + 1}"]
+                options = (
+                    [(term_indices[0],)]
+                    if filler == "term"
+                    else [
+                        tuple(term_indices[nested_part] if isinstance(nested_part, int) else nested_part for nested_part in nested)
+                        for nested in _compile_alternatives(filler)
+                    ]
+                )
 
-    templates = phrase_templates["response_global"]
+            expansions = [expansion + option for expansion in expansions for option in options]
 
-    template = random.sample(templates, 1)[0]
+        n_expansions.add(len(expansions))
+        alternatives.extend(_merge_literals(expansion) for expansion in expansions)
 
-    return template.replace("Term1", term_phrase_template(terms[0])).replace("Term2", existence_global_phrase_template([terms[1]]))
+    if len(n_expansions) > 1:
+        raise ValueError(f"The templates of '{name}' do not use the same nested templates.")
 
+    return tuple(alternatives)
 
-def absence_after_phrase_template(terms: List[PairTerm]):
-    accepted_terms = 2
-    if len(terms) != accepted_terms:
-        raise Exception(f"Too many terms for 'absence_global' formula, got {len(terms)} expected {accepted_terms}")
 
-    templates = phrase_templates["absence_after"]
+compiled_logical_operator_phrase_templates = {
+    (logical_operator, n_identifiers): tuple(compile_template(template) for template in templates)
+    for logical_operator, templates_by_size in logical_operator_phrase_templates.items()
+    for n_identifiers, templates in templates_by_size.items()
+}
 
-    template = random.sample(templates, 1)[0]
 
-    return template.replace("Term1", term_phrase_template(terms[0])).replace("Term2", absence_global_phrase_template([terms[1]]))
+def term_phrase_template(term: PairTerm, rng=random) -> str:
+    identifiers = term.identifiers
 
+    if term.logical_operator is None:
+        return identifiers[0].get_phrase_string(rng)
 
-def existence_after_phrase_template(terms: List[PairTerm]):
-    accepted_terms = 2
-    if len(terms) != accepted_terms:
-        raise Exception(f"Too many terms for 'absence_global' formula, got {len(terms)} expected {accepted_terms}")
+    # the variant is chosen first, so that only the identifiers it contains are rendered
+    variant = rng.choice(compiled_logical_operator_phrase_templates[term.logical_operator, len(identifiers)])
+    return ''.join([part if part.__class__ is str else identifiers[part].get_phrase_string(rng) for part in variant])
 
-    templates = phrase_templates["existence_after"]
 
-    template = random.sample(templates, 1)[0]
+class CompiledPhraseTemplate:
+    """The phrase template of a PairType, compiled once into flat alternatives of literals and term slots."""
+    __slots__ = ("name", "n_terms", "alternatives")
 
-    return template.replace("Term1", existence_global_phrase_template([terms[0]])).replace("Term2", existence_global_phrase_template([terms[1]]))
+    def __init__(self, name: str, alternatives: tuple = None):
+        self.name = name
+        self.alternatives = alternatives if alternatives is not None else _compile_alternatives(name)
+        self.n_terms = len({part for alternative in self.alternatives for part in alternative if isinstance(part, int)})
 
+    def __call__(self, terms: List[PairTerm], rng=random) -> str:
+        if len(terms) != self.n_terms:
+            raise Exception(f"Wrong number of terms for '{self.name}' formula, got {len(terms)} expected {self.n_terms}")
 
-def response_after_phrase_template(terms: List[PairTerm]):
-    accepted_terms = 3
-    if len(terms) != accepted_terms:
-        raise Exception(f"Too many terms for 'absence_global' formula, got {len(terms)} expected {accepted_terms}")
+        alternative = rng.choice(self.alternatives)
+        return ''.join([part if part.__class__ is str else term_phrase_template(terms[part], rng) for part in alternative])
 
-    templates = phrase_templates["response_after"]
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.name!r})"
 
-    template = random.sample(templates, 1)[0]
+    def __reduce__(self):
+        # pickled with its alternatives, templates registered at run time may be missing in other processes
+        return self.__class__, (self.name, self.alternatives)
 
-    return template.replace("Term1", term_phrase_template(terms[0])).replace("Term2",
-                                                                             response_global_phrase_template([terms[1], terms[2]]))
 
+@functools.lru_cache(maxsize=None)
+def get_phrase_template(name: str) -> CompiledPhraseTemplate:
+    return CompiledPhraseTemplate(name)
 
-def universal_after_phrase_template(terms: List[PairTerm]):
-    accepted_terms = 2
-    if len(terms) != accepted_terms:
-        raise Exception(f"Too many terms for 'absence_global' formula, got {len(terms)} expected {accepted_terms}")
 
-    templates = phrase_templates["universal_after"]
+def register_phrase_templates(name: str, templates: List[str], slots: dict) -> CompiledPhraseTemplate:
+    phrase_templates[name] = list(templates)
+    phrase_template_slots[name] = {slot: tuple(filler) for slot, filler in slots.items()}
+    _compile_alternatives.cache_clear()
+    get_phrase_template.cache_clear()
+    return get_phrase_template(name)
 
-    template = random.sample(templates, 1)[0]
 
-    return template.replace("Term1", term_phrase_template(terms[0])).replace("Term2", universal_global_phrase_template([terms[1]]))
+absence_global_phrase_template = get_phrase_template("absence_global")
+existence_global_phrase_template = get_phrase_template("existence_global")
+universal_global_phrase_template = get_phrase_template("universal_global")
+response_global_phrase_template = get_phrase_template("response_global")
+absence_after_phrase_template = get_phrase_template("absence_after")
+existence_after_phrase_template = get_phrase_template("existence_after")
+response_after_phrase_template = get_phrase_template("response_after")
+universal_after_phrase_template = get_phrase_template("universal_after")
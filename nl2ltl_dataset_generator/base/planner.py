@@ -0,0 +1,132 @@
+import csv
+import io
+import time
+from dataclasses import dataclass, field
+from typing import List
+
+from nl2ltl_dataset_generator.base.core import PairGenerationStrategy
+from nl2ltl_dataset_generator.base.data_model import PairType, Shard, derive_seed
+from nl2ltl_dataset_generator.base.loader import CSV_COLUMNS, pair_to_row
+from nl2ltl_dataset_generator.base.parallel import generate_shard
+
+DEFAULT_CALIBRATION_SAMPLES = 500
+
+
+@dataclass
+class PairTypePlan:
+    pair_type: PairType
+    requested_samples: int
+    n_available_terms: int
+    n_available_pairs: int
+    seconds_per_sample: float = None
+    setup_seconds: float = None
+    bytes_per_sample: float = None
+
+    @property
+    def achievable_samples(self) -> int:
+        return min(self.requested_samples, self.n_available_pairs)
+
+    @property
+    def is_feasible(self) -> bool:
+        return self.requested_samples <= self.n_available_pairs
+
+    @property
+    def projected_seconds(self) -> float:
+        if self.seconds_per_sample is None:
+            return None
+        return self.setup_seconds + self.seconds_per_sample * self.achievable_samples
+
+    @property
+    def projected_bytes(self) -> float:
+        if self.bytes_per_sample is None:
+            return None
+        return self.bytes_per_sample * self.achievable_samples
+
+
+@dataclass
+class DatasetPlan:
+    pair_type_plans: List[PairTypePlan] = field(default_factory=list)
+    workers: int = 1
+
+    @property
+    def is_feasible(self) -> bool:
+        return all(plan.is_feasible for plan in self.pair_type_plans)
+
+    @property
+    def projected_seconds(self) -> float:
+        """Projected generation time, assuming the shards are evenly spread among the workers."""
+        return sum(plan.projected_seconds or 0 for plan in self.pair_type_plans) / self.workers
+
+    @property
+    def projected_bytes(self) -> int:
+        header_bytes = len(",".join(CSV_COLUMNS)) + 1
+        return int(header_bytes + sum(plan.projected_bytes or 0 for plan in self.pair_type_plans))
+
+    def get_warnings(self) -> List[str]:
+        return [
+            f"'{plan.pair_type}' requires {plan.requested_samples} unique pairs but the identifiers allow only "
+            f"{plan.n_available_pairs}"
+            for plan in self.pair_type_plans if not plan.is_feasible
+        ]
+
+    def __str__(self):
+        lines = [f"{'pair type':<18}{'requested':>11}{'terms':>14}{'pairs':>14}{'achievable':>12}{'seconds':>10}{'MB':>9}"]
+
+        for plan in self.pair_type_plans:
+            seconds = f"{plan.projected_seconds:.2f}" if plan.projected_seconds is not None else "-"
+            megabytes = f"{plan.projected_bytes / 1e6:.2f}" if plan.projected_bytes is not None else "-"
+            lines.append(
+                f"{str(plan.pair_type):<18}{plan.requested_samples:>11}{_format_count(plan.n_available_terms):>14}"
+                f"{_format_count(plan.n_available_pairs):>14}{plan.achievable_samples:>12}{seconds:>10}{megabytes:>9}"
+            )
+
+        lines.append(f"Projected time: {self.projected_seconds:.2f} s with {self.workers} worker(s)")
+        lines.append(f"Projected size: {self.projected_bytes / 1e6:.2f} MB")
+        lines.extend(f"WARNING: {warning}" for warning in self.get_warnings())
+
+        return "\n".join(lines)
+
+
+def _format_count(count: int) -> str:
+    return str(count) if count < 10 ** 12 else f"{count:.3e}"
+
+
+def _get_csv_size(pairs) -> int:
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(pair_to_row(pair) for pair in pairs)
+    return len(buffer.getvalue().encode())
+
+
+def plan_dataset(generation_strategy: PairGenerationStrategy,
+                 seed: int = 0,
+                 workers: int = 1,
+                 calibration_samples: int = DEFAULT_CALIBRATION_SAMPLES) -> DatasetPlan:
+    """Compute the size of the term and pair spaces of every PairType and project time and size of the generation.
+
+    The projections come from a short calibration run of at most calibration_samples pairs for each feasible PairType.
+    The dataset distribution must be already updated, see DatasetDistribution.update_info.
+    """
+    dataset_plan = DatasetPlan(workers=workers)
+
+    for pair_type_index, pair_type in enumerate(generation_strategy.dataset_distribution.pair_types):
+        plan = PairTypePlan(pair_type, pair_type.distribution.new_value, *generation_strategy.get_space_size(pair_type_index))
+        dataset_plan.pair_type_plans.append(plan)
+
+        if not plan.is_feasible or plan.requested_samples == 0:
+            continue
+
+        pair_type_seed = derive_seed(seed, pair_type_index)
+        n_samples = min(calibration_samples, plan.requested_samples)
+
+        # the first shard pays the one-off setup of the PairType (e.g. the selection of the unique pairs)
+        start_time = time.perf_counter()
+        generate_shard(generation_strategy, Shard(pair_type_index, 0, 0, 1, pair_type_seed, derive_seed(seed, pair_type_index, 0)))
+        setup_seconds = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        pairs = generate_shard(generation_strategy, Shard(pair_type_index, 1, 0, n_samples, pair_type_seed, derive_seed(seed, pair_type_index, 1)))
+        plan.seconds_per_sample = (time.perf_counter() - start_time) / n_samples
+        plan.setup_seconds = max(setup_seconds - plan.seconds_per_sample, 0)
+        plan.bytes_per_sample = _get_csv_size(pairs) / n_samples
+
+    return dataset_plan
@@ -0,0 +1,168 @@
+import collections
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Iterable, Generator, Any
+
+SETUP_STAGE = "setup"
+IDENTIFIERS_STAGE = "identifiers"
+SAMPLING_STAGE = "sampling"
+RENDERING_STAGE = "rendering"
+# deduplication, validation and anything else done to the generated chunks
+POSTPROCESSING_STAGE = "postprocessing"
+EXPORT_STAGE = "export"
+# waiting for the chunks sampled and rendered by worker processes, which are not profiled
+WORKERS_STAGE = "workers"
+# seconds between two samples of the stack of the main thread
+DEFAULT_STACKS_INTERVAL = .005
+
+
+def get_rss() -> int:
+    """Resident set size of the process, in bytes."""
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # the peak resident set size, in kilobytes on Linux and in bytes on macOS
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+@dataclass
+class StageProfile:
+    """What a stage cost, excluding the stages nested in it."""
+    name: str
+    calls: int = 0
+    wall_seconds: float = 0.
+    cpu_seconds: float = 0.
+    # highest memory allocated by Python while the stage was running
+    peak_traced_bytes: int = 0
+    rss_delta_bytes: int = 0
+
+
+class Profiler:
+    """Records wall time, CPU time, peak traced memory and RSS growth of the stages of a run.
+
+    Stages can be nested and entered many times: their costs are accumulated, and a stage is not charged for the
+    stages nested in it. Optionally, the stack of the main thread is sampled in the background and counted in the
+    collapsed format of flamegraph tools, with the running stage as its root.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.stages: Dict[str, StageProfile] = {}
+        self.stacks = collections.Counter()
+        self._running: List[str] = []
+        self._mark = None
+        self._stop = threading.Event()
+        self._sampler: threading.Thread = None
+
+    def start(self, sample_stacks: bool = False, stacks_interval: float = DEFAULT_STACKS_INTERVAL) -> None:
+        self.enabled = True
+        tracemalloc.start()
+        self._mark = self._now()
+
+        if sample_stacks:
+            self._sampler = threading.Thread(
+                target=self._sample_stacks, args=(threading.main_thread().ident, stacks_interval), daemon=True
+            )
+            self._sampler.start()
+
+    def stop(self) -> None:
+        self._charge()
+        self.disable()
+
+        if self._sampler is not None:
+            self._stop.set()
+            self._sampler.join()
+
+    def disable(self) -> None:
+        """Stop recording, e.g. in the forked workers, whose stages are not profiled."""
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @staticmethod
+    def _now() -> tuple:
+        return time.perf_counter(), time.process_time(), get_rss()
+
+    def _charge(self) -> None:
+        """Charge the costs since the last mark to the running stage."""
+        now = self._now()
+
+        if self._running:
+            stage = self.stages[self._running[-1]]
+            stage.wall_seconds += now[0] - self._mark[0]
+            stage.cpu_seconds += now[1] - self._mark[1]
+            stage.rss_delta_bytes += now[2] - self._mark[2]
+            stage.peak_traced_bytes = max(stage.peak_traced_bytes, tracemalloc.get_traced_memory()[1])
+
+        tracemalloc.reset_peak()
+        self._mark = now
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+
+        self._charge()
+        self.stages.setdefault(name, StageProfile(name)).calls += 1
+        self._running.append(name)
+        try:
+            yield
+        finally:
+            self._charge()
+            self._running.pop()
+
+    def profile_chunks(self, chunks: Iterable[list], name: str) -> Generator[list, Any, None]:
+        """Charge to the stage the production of each chunk, not what the consumer does with it."""
+        chunks = iter(chunks)
+
+        while True:
+            with self.stage(name):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    def _sample_stacks(self, thread_id: int, interval: float) -> None:
+        while not self._stop.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            frames = []
+            while frame is not None:
+                frames.append(f"{Path(frame.f_code.co_filename).stem}:{frame.f_code.co_name}")
+                frame = frame.f_back
+
+            root = self._running[-1] if self._running else "main"
+            self.stacks[";".join([root, *reversed(frames)])] += 1
+
+    def to_dict(self) -> dict:
+        return {name: asdict(stage) for name, stage in self.stages.items()}
+
+    def save(self, file_path: Path) -> None:
+        file_path.write_text(json.dumps(self.to_dict(), indent=2))
+
+    def save_stacks(self, file_path: Path) -> None:
+        """One `root;caller;callee count` line per sampled stack."""
+        file_path.write_text("".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common()))
+
+    def get_report(self) -> str:
+        lines = [f"{'stage':<16}{'calls':>7}{'wall s':>10}{'cpu s':>10}{'peak MB':>10}{'rss MB':>10}"]
+        lines.extend(
+            f"{stage.name:<16}{stage.calls:>7}{stage.wall_seconds:>10.3f}{stage.cpu_seconds:>10.3f}"
+            f"{stage.peak_traced_bytes / 2 ** 20:>10.1f}{stage.rss_delta_bytes / 2 ** 20:>+10.1f}"
+            for stage in self.stages.values()
+        )
+        if WORKERS_STAGE in self.stages:
+            lines.append(f"sampling and rendering ran in worker processes, {WORKERS_STAGE} is the time spent waiting for them")
+        return "\n".join(lines)
+
+
+profiler = Profiler()
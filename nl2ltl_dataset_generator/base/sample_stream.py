@@ -0,0 +1,136 @@
+import queue
+import random
+import threading
+from pathlib import Path
+from typing import List, NamedTuple
+
+from nl2ltl_dataset_generator.base.core import generation_strategy_factory
+from nl2ltl_dataset_generator.base.data_model import DatasetDistribution, DatasetType, derive_seed
+from nl2ltl_dataset_generator.base.parallel import ShardedDatasetGenerator
+from nl2ltl_dataset_generator.base.patterns import PatternDeclaration, default_pattern_declarations, build_pair_types
+
+DEFAULT_WINDOW_SIZE = 10000
+DEFAULT_PREFETCH = 4
+# seconds between two checks of the stop event, while the queue is full or empty
+_QUEUE_TIMEOUT = .1
+
+
+class Sample(NamedTuple):
+    en: str
+    ltl: str
+    pair_type: str
+
+
+class SampleStream:
+    """Endless iterator of freshly generated samples, e.g. to train on new data at every epoch without any file.
+
+    Samples are generated in windows of window_size samples, each one with the DatasetDistribution proportions and
+    its own seed derived from the seed, so the stream only depends on the seed and the window size. A background
+    thread keeps up to prefetch windows ready in a bounded queue, generating the next ones while the samples are
+    consumed. Samples are shuffled within their window, unless shuffle is False.
+    """
+    def __init__(self, dataset_type: DatasetType, identifiers_file_path: Path = None, seed: int = None,
+                 window_size: int = DEFAULT_WINDOW_SIZE, pattern_declarations: List[PatternDeclaration] = None,
+                 prefetch: int = DEFAULT_PREFETCH, shuffle: bool = True, batch_rendering: bool = False):
+        if dataset_type is DatasetType.UNRESTRICTED and identifiers_file_path is None:
+            raise ValueError("Unrestricted samples need an identifiers_file_path.")
+
+        self.dataset_type = dataset_type
+        self.seed = seed if seed is not None else random.SystemRandom().randrange(2 ** 32)
+        self.window_size = window_size
+        self.shuffle = shuffle
+
+        pair_types = build_pair_types(pattern_declarations if pattern_declarations is not None else default_pattern_declarations)
+        self.dataset_distribution = DatasetDistribution(window_size, pair_types)
+        self.dataset_distribution.update_info()
+        self.generation_strategy = generation_strategy_factory(
+            dataset_type, self.dataset_distribution, identifiers_file_path, batch_rendering
+        )
+
+        self._windows = queue.Queue(maxsize=prefetch)
+        self._stop = threading.Event()
+        self._thread: threading.Thread = None
+        self._window: List[Sample] = []
+        self._position = 0
+        # the error of the prefetch thread, raised again by every later call to __next__
+        self._error: Exception = None
+        self.n_windows = 0
+
+    def get_window(self, window_index: int) -> List[Sample]:
+        """The samples of a window, generated in the calling thread."""
+        window_seed = derive_seed(self.seed, window_index)
+        dataset_generator = ShardedDatasetGenerator(
+            self.dataset_distribution, self.dataset_type, self.generation_strategy, window_seed, shard_size=self.window_size
+        )
+
+        window = [
+            Sample(pair.phrase, pair.formula, str(pair.pair_type))
+            for chunk in dataset_generator.generate_chunks() for pair in chunk
+        ]
+        if self.shuffle:
+            random.Random(window_seed).shuffle(window)
+
+        return window
+
+    def _get(self):
+        while not self._stop.is_set():
+            try:
+                return self._windows.get(timeout=_QUEUE_TIMEOUT)
+            except queue.Empty:
+                pass
+        raise StopIteration
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._windows.put(item, timeout=_QUEUE_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _prefetch(self) -> None:
+        window_index = 0
+        try:
+            while self._put(self.get_window(window_index)):
+                window_index += 1
+        except Exception as error:
+            # raised again by the consumer
+            self._put(error)
+
+    def start(self) -> 'SampleStream':
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._prefetch, name="SampleStream", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self) -> None:
+        """Stop the background thread, the windows already prefetched are dropped."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> 'SampleStream':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
+
+    def __iter__(self) -> 'SampleStream':
+        return self.start()
+
+    def __next__(self) -> Sample:
+        if self._position == len(self._window):
+            if self._error is not None:
+                raise self._error
+            window = self.start()._get()
+            if isinstance(window, Exception):
+                # the prefetch thread has stopped
+                self._error = window
+                raise window
+            self._window, self._position = window, 0
+            self.n_windows += 1
+
+        sample = self._window[self._position]
+        self._position += 1
+        return sample
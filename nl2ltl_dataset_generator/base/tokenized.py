@@ -0,0 +1,151 @@
+import re
+from pathlib import Path
+from typing import List, Iterable, Generator, Any, Dict
+
+import numpy as np
+
+from nl2ltl_dataset_generator.base.data_model import Pair
+from nl2ltl_dataset_generator.base.ltl import tokenize
+
+# reserved ids of every vocabulary, <unk> is never written but lets consumers map unseen tokens
+SPECIAL_TOKENS = ("<pad>", "<unk>")
+TOKEN_DTYPE = np.uint32
+OFFSET_DTYPE = np.int64
+PAIR_TYPE_DTYPE = np.uint16
+# words and punctuation of the phrases
+PHRASE_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+# bytes reserved to the header of the .npy files, rewritten with the final shape once they are complete
+NPY_HEADER_SIZE = 128
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+
+def tokenize_phrase(phrase: str) -> List[str]:
+    return PHRASE_TOKEN_PATTERN.findall(phrase)
+
+
+def tokenize_formula(formula: str) -> List[str]:
+    """The operators, parentheses and atomic propositions of the formula, see ltl.tokenize."""
+    return tokenize(formula)
+
+
+class Vocabulary:
+    """Token ids assigned in order of first appearance, after SPECIAL_TOKENS."""
+    def __init__(self):
+        self.ids: Dict[str, int] = {token: token_id for token_id, token in enumerate(SPECIAL_TOKENS)}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def encode(self, tokens: List[str]) -> List[int]:
+        ids = self.ids
+        return [ids[token] if token in ids else ids.setdefault(token, len(ids)) for token in tokens]
+
+    def save(self, file_path: Path) -> None:
+        """One token per line, the line number (from 0) being its id."""
+        file_path.write_text("".join(f"{token}\n" for token in self.ids))
+
+
+class NpyAppender:
+    """A one-dimensional .npy file written incrementally.
+
+    The header is written with room for any shape and rewritten with the final one when the file is closed, so the
+    data is never copied and the file can be memory-mapped with np.load(file_path, mmap_mode='r').
+    """
+    def __init__(self, file_path: Path, dtype):
+        self.file_path = file_path
+        self.dtype = np.dtype(dtype)
+        self.length = 0
+        self._fp = file_path.open('wb')
+        self._write_header()
+
+    def _write_header(self) -> None:
+        header = repr({"descr": np.lib.format.dtype_to_descr(self.dtype), "fortran_order": False, "shape": (self.length,)})
+        header = header.ljust(NPY_HEADER_SIZE - len(NPY_MAGIC) - 3) + "\n"
+        self._fp.seek(0)
+        self._fp.write(NPY_MAGIC + len(header).to_bytes(2, "little") + header.encode("latin1"))
+
+    def append(self, values: Iterable[int]) -> None:
+        values = np.fromiter(values, self.dtype)
+        values.tofile(self._fp)
+        self.length += len(values)
+
+    def close(self) -> None:
+        self._write_header()
+        self._fp.close()
+
+
+class TokenizedDatasetWriter:
+    """Writes rendered pairs as flat arrays of token ids, building the vocabularies while the pairs stream out.
+
+    In directory_path, for src (the phrases) and tgt (the formulas):
+
+    - {src,tgt}-tokens.npy: the token ids of all the pairs, one after the other;
+    - {src,tgt}-offsets.npy: where the tokens of each pair start, the i-th pair being tokens[offsets[i]:offsets[i + 1]];
+    - {src,tgt}-vocab.txt: the token of each id, one per line;
+
+    and pair-types.npy with the index of the pattern of each pair in pair-types.txt.
+    """
+    def __init__(self, directory_path: Path):
+        self.directory_path = directory_path
+        self.vocabularies = {"src": Vocabulary(), "tgt": Vocabulary()}
+        self.pair_types: Dict[str, int] = {}
+        self.n_pairs = 0
+        self._tokens: Dict[str, NpyAppender] = {}
+        self._offsets: Dict[str, NpyAppender] = {}
+        self._pair_types: NpyAppender = None
+
+    def __enter__(self) -> "TokenizedDatasetWriter":
+        self.directory_path.mkdir(parents=True, exist_ok=True)
+
+        for side in self.vocabularies:
+            self._tokens[side] = NpyAppender(self.directory_path / f"{side}-tokens.npy", TOKEN_DTYPE)
+            self._offsets[side] = NpyAppender(self.directory_path / f"{side}-offsets.npy", OFFSET_DTYPE)
+            self._offsets[side].append([0])
+        self._pair_types = NpyAppender(self.directory_path / "pair-types.npy", PAIR_TYPE_DTYPE)
+
+        return self
+
+    def __exit__(self, *exc_info):
+        for appender in (*self._tokens.values(), *self._offsets.values(), self._pair_types):
+            appender.close()
+
+        for side, vocabulary in self.vocabularies.items():
+            vocabulary.save(self.directory_path / f"{side}-vocab.txt")
+        (self.directory_path / "pair-types.txt").write_text("".join(f"{pair_type}\n" for pair_type in self.pair_types))
+
+    def _write_side(self, side: str, token_lists: List[List[str]]) -> None:
+        vocabulary = self.vocabularies[side]
+        offset = self._tokens[side].length
+        ids, offsets = [], []
+
+        for tokens in token_lists:
+            ids.extend(vocabulary.encode(tokens))
+            offset += len(tokens)
+            offsets.append(offset)
+
+        self._tokens[side].append(ids)
+        self._offsets[side].append(offsets)
+
+    def write(self, pairs: Iterable[Pair]) -> None:
+        pairs = list(pairs)
+
+        self._write_side("src", [tokenize_phrase(pair.phrase) for pair in pairs])
+        self._write_side("tgt", [tokenize_formula(pair.formula) for pair in pairs])
+        self._pair_types.append(
+            self.pair_types.setdefault(str(pair.pair_type), len(self.pair_types)) for pair in pairs
+        )
+        self.n_pairs += len(pairs)
+
+    def tee(self, chunks: Iterable[List[Pair]]) -> Generator[List[Pair], Any, None]:
+        """Write each chunk and pass it on, e.g. to save_csv_stream."""
+        for chunk in chunks:
+            self.write(chunk)
+            yield chunk
+
+
+def load_tokenized_dataset(directory_path: Path, side: str = "src") -> tuple:
+    """Memory-map the (tokens, offsets) of a side written by TokenizedDatasetWriter, with its vocabulary."""
+    tokens = np.load(directory_path / f"{side}-tokens.npy", mmap_mode='r')
+    offsets = np.load(directory_path / f"{side}-offsets.npy", mmap_mode='r')
+    vocabulary = (directory_path / f"{side}-vocab.txt").read_text().split("\n")[:-1]
+    return tokens, offsets, vocabulary
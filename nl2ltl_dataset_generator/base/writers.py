@@ -0,0 +1,262 @@
+import contextlib
+import csv
+import gzip
+import io
+import json
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Iterable
+
+from nl2ltl_dataset_generator.base.data_model import Pair
+from nl2ltl_dataset_generator.base.loader import CSV_COLUMNS, pair_to_row
+from nl2ltl_dataset_generator.base.log import log_time
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def _import_optional(module_name: str, output_format: str):
+    try:
+        return __import__(module_name, fromlist=["_"])
+    except ImportError:
+        raise Exception(f"The {output_format} output requires {module_name.split('.')[0]}, please install it.") from None
+
+
+def open_text(file_path: Path, compression: str = None) -> io.TextIOBase:
+    if compression == "gzip":
+        return gzip.open(file_path, 'wt', newline='')
+    if compression == "zstd":
+        return _import_optional("zstandard", "zstd").open(file_path, 'wt', newline='')
+    return file_path.open('w', newline='')
+
+
+class RowsFile(ABC):
+    """A file open for writing, encoding the rows (lists of CSV_COLUMNS values) it is given as they arrive."""
+    @abstractmethod
+    def write(self, rows: List[List[str]]) -> None:
+        pass
+
+    @abstractmethod
+    def close(self) -> None:
+        pass
+
+
+class RowsWriter(ABC):
+    """Opens the files of a format, each one written incrementally by a RowsFile."""
+    suffix: str = None
+    compressions = (None, "gzip", "zstd")
+    # formats compressing internally do not get the suffix of the compression
+    compressed_internally = False
+    # optional package needed by the format, checked before anything is generated
+    required_module: str = None
+
+    def __init__(self, compression: str = None):
+        if compression not in self.compressions:
+            raise Exception(f"The {self.suffix} output does not support {compression} compression.")
+        if self.required_module is not None:
+            _import_optional(self.required_module, self.suffix)
+        if compression == "zstd" and not self.compressed_internally:
+            _import_optional("zstandard", compression)
+        self.compression = compression
+
+    def get_suffix(self) -> str:
+        if self.compression is None or self.compressed_internally:
+            return f".{self.suffix}"
+        return f".{self.suffix}{COMPRESSION_SUFFIXES[self.compression]}"
+
+    @abstractmethod
+    def open(self, file_path: Path) -> RowsFile:
+        pass
+
+
+class CsvRowsFile(RowsFile):
+    def __init__(self, fp: io.TextIOBase):
+        self.fp = fp
+        self.writer = csv.writer(fp, lineterminator='\n')
+        self.writer.writerow(CSV_COLUMNS)
+
+    def write(self, rows: List[List[str]]) -> None:
+        self.writer.writerows(rows)
+
+    def close(self) -> None:
+        self.fp.close()
+
+
+class CsvRowsWriter(RowsWriter):
+    suffix = "csv"
+
+    def open(self, file_path: Path) -> RowsFile:
+        return CsvRowsFile(open_text(file_path, self.compression))
+
+
+class JsonlRowsFile(RowsFile):
+    def __init__(self, fp: io.TextIOBase):
+        self.fp = fp
+
+    def write(self, rows: List[List[str]]) -> None:
+        self.fp.writelines(f"{json.dumps(dict(zip(CSV_COLUMNS, row)), ensure_ascii=False)}\n" for row in rows)
+
+    def close(self) -> None:
+        self.fp.close()
+
+
+class JsonlRowsWriter(RowsWriter):
+    suffix = "jsonl"
+
+    def open(self, file_path: Path) -> RowsFile:
+        return JsonlRowsFile(open_text(file_path, self.compression))
+
+
+def _get_schema(output_format: str):
+    pa = _import_optional("pyarrow", output_format)
+    return pa.schema([(column, pa.string()) for column in CSV_COLUMNS])
+
+
+def _get_table(rows: List[List[str]], schema):
+    pa = _import_optional("pyarrow", "arrow")
+    return pa.table({column: [row[index] for row in rows] for index, column in enumerate(CSV_COLUMNS)}, schema=schema)
+
+
+class ParquetRowsFile(RowsFile):
+    """Each write is a row group."""
+    def __init__(self, file_path: Path, compression: str = None):
+        pq = _import_optional("pyarrow.parquet", "parquet")
+        self.schema = _get_schema("parquet")
+        self.writer = pq.ParquetWriter(str(file_path), self.schema, compression=compression or "none")
+
+    def write(self, rows: List[List[str]]) -> None:
+        self.writer.write_table(_get_table(rows, self.schema))
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class ParquetRowsWriter(RowsWriter):
+    suffix = "parquet"
+    compressed_internally = True
+    required_module = "pyarrow.parquet"
+
+    def open(self, file_path: Path) -> RowsFile:
+        return ParquetRowsFile(file_path, self.compression)
+
+
+class ArrowRowsFile(RowsFile):
+    """Each write is a record batch."""
+    def __init__(self, file_path: Path, compression: str = None):
+        pa = _import_optional("pyarrow", "arrow")
+        self.schema = _get_schema("arrow")
+        self.sink = pa.OSFile(str(file_path), 'wb')
+        self.writer = pa.ipc.new_file(self.sink, self.schema, options=pa.ipc.IpcWriteOptions(compression=compression))
+
+    def write(self, rows: List[List[str]]) -> None:
+        self.writer.write_table(_get_table(rows, self.schema))
+
+    def close(self) -> None:
+        self.writer.close()
+        self.sink.close()
+
+
+class ArrowRowsWriter(RowsWriter):
+    """Arrow IPC file format, whose buffers can only be compressed with zstd (or lz4)."""
+    suffix = "arrow"
+    compressions = (None, "zstd")
+    compressed_internally = True
+    required_module = "pyarrow"
+
+    def open(self, file_path: Path) -> RowsFile:
+        return ArrowRowsFile(file_path, self.compression)
+
+
+rows_writers = {
+    "csv": CsvRowsWriter,
+    "jsonl": JsonlRowsWriter,
+    "parquet": ParquetRowsWriter,
+    "arrow": ArrowRowsWriter,
+}
+
+OUTPUT_FORMATS = tuple(rows_writers)
+COMPRESSIONS = tuple(COMPRESSION_SUFFIXES)
+
+
+class DatasetWriter:
+    """Writes chunks of rendered pairs to files of at most shard_rows rows, or to a single file.
+
+    Each chunk is handed to the open file as soon as it is generated, and encoded and written by a background thread
+    while the following chunks are generated. With shard_rows, the files are spread over the threads, each file being
+    written by a single one so that its rows stay in order. Compression and the pyarrow encoders release the GIL, so
+    most of their work overlaps with the generation.
+    """
+    def __init__(self, file_path: Path, output_format: str = "csv", compression: str = None, shard_rows: int = None,
+                 threads: int = 1):
+        self.file_path = file_path
+        self.rows_writer = rows_writers[output_format](compression)
+        self.shard_rows = shard_rows
+        self.threads = threads
+        self.file_paths: List[Path] = []
+        self.n_rows = 0
+
+    def get_shard_path(self, shard_index: int = None) -> Path:
+        shard_suffix = f"-{shard_index:05d}" if shard_index is not None else ""
+        return self.file_path.parent / f"{self.file_path.stem}{shard_suffix}{self.rows_writer.get_suffix()}"
+
+    @log_time
+    def write(self, chunks: Iterable[List[Pair]]) -> int:
+        """Write the chunks, returns the number of written rows."""
+        pending = deque()
+        rows_file: RowsFile = None
+        executor: ThreadPoolExecutor = None
+        file_rows = 0
+
+        with contextlib.ExitStack() as stack:
+            # a single thread per executor, so that the writes of a file run in order
+            executors = [stack.enter_context(ThreadPoolExecutor(1)) for _ in range(self.threads)]
+
+            def submit(function, *args) -> None:
+                pending.append(executor.submit(function, *args))
+                # keep a bounded number of chunks in memory when the writers are slower than the generation
+                while len(pending) > 2 * self.threads:
+                    pending.popleft().result()
+
+            def open_file() -> RowsFile:
+                nonlocal executor
+                file_path = self.get_shard_path(len(self.file_paths) if self.shard_rows is not None else None)
+                executor = executors[len(self.file_paths) % self.threads]
+                self.file_paths.append(file_path)
+                return self.rows_writer.open(file_path)
+
+            try:
+                for chunk in chunks:
+                    rows = [pair_to_row(pair) for pair in chunk]
+                    self.n_rows += len(rows)
+                    start = 0
+
+                    while start < len(rows):
+                        if rows_file is None:
+                            rows_file, file_rows = open_file(), 0
+
+                        stop = len(rows) if self.shard_rows is None else min(len(rows), start + self.shard_rows - file_rows)
+                        submit(rows_file.write, rows[start:stop])
+                        file_rows += stop - start
+                        start = stop
+
+                        if self.shard_rows is not None and file_rows == self.shard_rows:
+                            full_file, rows_file = rows_file, None
+                            submit(full_file.close)
+
+                if rows_file is None and not self.file_paths:
+                    rows_file = open_file()
+            except BaseException:
+                # close the file being written after its pending writes, so that it is flushed (or gets its footer)
+                # before the error propagates
+                if rows_file is not None:
+                    executor.submit(rows_file.close)
+                raise
+
+            if rows_file is not None:
+                submit(rows_file.close)
+
+            while pending:
+                pending.popleft().result()
+
+        return self.n_rows
@@ -0,0 +1,119 @@
+import dataclasses
+import json
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, Tuple
+
+import click
+
+from nl2ltl_dataset_generator.base import *
+from nl2ltl_dataset_generator.base.exceptions import InvalidGenerationRequest
+from nl2ltl_dataset_generator.server import GenerationRequest, GenerationState
+
+_worker_state: GenerationState = None
+
+
+@dataclasses.dataclass
+class BatchJob(GenerationRequest):
+    """A dataset of the batch: the options of a GenerationRequest and where to save it."""
+    dataset_save_path: str = "./results/dataset.csv"
+
+
+def load_batch_jobs(file_path: Path) -> List[BatchJob]:
+    """Read the jobs of a JSON or YAML file, either a list of jobs or a mapping with the jobs and the defaults shared
+    by all of them, e.g. {"defaults": {"dataset_type": "restricted"}, "jobs": [{"seed": 1}, {"seed": 2}]}."""
+    if file_path.suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise Exception("YAML job files require PyYAML, please install it or use a JSON job file.") from None
+        content = yaml.safe_load(file_path.read_text())
+    else:
+        content = json.loads(file_path.read_text())
+
+    if isinstance(content, list):
+        content = {"jobs": content}
+    if not isinstance(content, dict) or not isinstance(content.get("jobs"), list):
+        raise InvalidGenerationRequest(f"{file_path} must contain a list of jobs")
+
+    jobs = []
+    for options in content["jobs"]:
+        try:
+            jobs.append(BatchJob(**{**content.get("defaults", {}), **options}))
+        except TypeError as error:
+            raise InvalidGenerationRequest(str(error)) from None
+
+    return jobs
+
+
+def load_batch_state(jobs: List[BatchJob]) -> GenerationState:
+    """Load each distinct identifiers and patterns file of the jobs once, checking the options of every job before
+    any dataset is generated."""
+    state = GenerationState()
+
+    for job in jobs:
+        state.get_dataset_generator(job)
+
+    return state
+
+
+def _initialize_worker(state: GenerationState) -> None:
+    global _worker_state
+    _worker_state = state
+    registry.disable(*registry.scopes)
+
+
+def _run_job(job: BatchJob) -> int:
+    return save_csv_stream(_worker_state.get_dataset_generator(job).generate_chunks(), Path(job.dataset_save_path))
+
+
+@log_time
+def run_batch(jobs: List[BatchJob], workers: int = 1) -> List[Tuple[BatchJob, Exception]]:
+    """Generate the dataset of every job on a pool of processes, each one holding a copy of the loaded files.
+
+    A dataset is the same that main writes for the same options. The jobs failing do not stop the others, their errors
+    are returned.
+    """
+    for job in jobs:
+        if job.seed is None:
+            job.seed = random.SystemRandom().randrange(2 ** 32)
+
+    state = load_batch_state(jobs)
+    failures = []
+
+    with ProcessPoolExecutor(min(workers, len(jobs)) or 1, initializer=_initialize_worker,
+                             initargs=(state,)) as executor:
+        futures = {executor.submit(_run_job, job): job for job in jobs}
+
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                n_rows = future.result()
+            except Exception as error:
+                failures.append((job, error))
+                print(f"Failed {Path(job.dataset_save_path).resolve()}: {error}")
+                continue
+            print(f"Dataset generated in {Path(job.dataset_save_path).resolve()}: {n_rows} rows, seed {job.seed}")
+
+    return failures
+
+
+@click.command()
+@click.argument("jobs_file_path", type=click.Path(dir_okay=False, exists=True))
+@click.option("--workers", "-w", type=click.IntRange(min=1), default=1, help="Number of processes running the jobs.")
+def batch(jobs_file_path: Path, workers: int):
+    registry.disable(*registry.scopes)
+
+    try:
+        jobs = load_batch_jobs(Path(jobs_file_path))
+        failures = run_batch(jobs, workers)
+    except InvalidGenerationRequest as error:
+        raise click.ClickException(str(error)) from None
+
+    if failures:
+        raise click.ClickException(f"{len(failures)} of {len(jobs)} jobs failed.")
+
+
+if __name__ == '__main__':
+    batch()
@@ -1,22 +1,18 @@
+import contextlib
 import random
 from pathlib import Path
+from typing import Tuple, List
 
 import click as click
 
 from nl2ltl_dataset_generator.base import *
 
 
-def initialize_application(n_samples: int = 10000) -> DatasetDistribution:
-    pair_types = [
-        PairType(Pattern.ABSENCE, Scope.GLOBAL, 1, absence_global_phrase_template, absence_global_formula_template, PairTypeDistribution(4)),
-        PairType(Pattern.UNIVERSAL, Scope.GLOBAL, 1, universal_global_phrase_template, universal_global_formula_template, PairTypeDistribution(14)),
-        PairType(Pattern.EXISTENCE, Scope.GLOBAL, 1, existence_global_phrase_template, existence_global_formula_template, PairTypeDistribution(5)),
-        PairType(Pattern.RESPONSE, Scope.GLOBAL, 2, response_global_phrase_template, response_global_formula_template, PairTypeDistribution(23)),
-        PairType(Pattern.ABSENCE, Scope.AFTER, 2, absence_after_phrase_template, absence_after_formula_template, PairTypeDistribution(1)),
-        PairType(Pattern.UNIVERSAL, Scope.AFTER, 2, universal_after_phrase_template, universal_after_formula_template, PairTypeDistribution(1)),
-        PairType(Pattern.EXISTENCE, Scope.AFTER, 2, existence_after_phrase_template, existence_after_formula_template, PairTypeDistribution(4)),
-        PairType(Pattern.RESPONSE, Scope.AFTER, 3, response_after_phrase_template, response_after_formula_template, PairTypeDistribution(3)),
-    ]
+def initialize_application(n_samples: int = 10000, pattern_declarations: List[PatternDeclaration] = None) -> DatasetDistribution:
+    if pattern_declarations is None:
+        pattern_declarations = default_pattern_declarations
+
+    pair_types = build_pair_types(pattern_declarations)
 
     new_dataset_distribution = DatasetDistribution(n_samples, pair_types)
 
@@ -31,41 +27,283 @@ def initialize_application(n_samples: int = 10000) -> DatasetDistribution:
 @click.option("--number-of-samples", "-s", type=int, default=10000)
 @click.option("--dataset-save-path", "-o", type=click.Path(file_okay=True, exists=False), default=Path("./results/dataset.csv"))
 @click.option("--identifiers-file-path", "-i", type=click.Path(file_okay=True, exists=False), required=False, default=None)
-@click.option("--seed", "-r", type=int, default=None, required=False)
+@click.option("--identifiers-sample-size", type=click.IntRange(min=1), default=None,
+              help="Use a uniform sample of this number of identifiers, read from the identifiers file in a single pass.")
+@click.option("--patterns-file-path", "-p", type=click.Path(file_okay=True, exists=False), required=False, default=None,
+              help="JSON file declaring the patterns to generate and their weights.")
+@click.option("--seed", "-r", type=click.IntRange(min=0), default=None, required=False)
+@click.option("--stream", is_flag=True, default=False, help="Write the dataset to disk chunk by chunk while generating it.")
+@click.option("--output-format", type=click.Choice(OUTPUT_FORMATS), default="csv", help="Format of the dataset files.")
+@click.option("--compression", type=click.Choice(COMPRESSIONS), default=None, help="Compression of the dataset files.")
+@click.option("--shard-rows", type=click.IntRange(min=1), default=None,
+              help="Split the dataset in files of at most this number of rows.")
+@click.option("--writer-threads", type=click.IntRange(min=1), default=1,
+              help="Number of threads encoding and writing the dataset files while the dataset is generated.")
+@click.option("--chunk-size", "-c", type=click.IntRange(min=1), default=DEFAULT_SHARD_SIZE,
+              help="Number of pairs per chunk, each chunk is generated from its own random stream.")
+@click.option("--workers", "-w", type=click.IntRange(min=1), default=1, help="Number of processes generating the chunks.")
+@click.option("--checkpoint-path", type=click.Path(file_okay=False, exists=False), default=None,
+              help="Directory where to save each chunk as soon as it is generated, together with a manifest of the run.")
+@click.option("--resume", is_flag=True, default=False,
+              help="Resume the run saved in the checkpoint path, generating only the chunks that are missing.")
+@click.option("--deduplicate", is_flag=True, default=False,
+              help="Replace the generated rows that are identical to previous ones, keeping the number of samples.")
+@click.option("--dedup-memory-limit", type=click.IntRange(min=1), default=DEFAULT_MEMORY_LIMIT // 2 ** 20,
+              help="Megabytes used to remember the generated rows, past it duplicates are detected with a Bloom filter.")
+@click.option("--dedup-by", type=click.Choice(["row", "formula"]), default="row",
+              help="Rows identical as a whole, or whose formulas are equivalent up to the order of the operands.")
+@click.option("--validate-formulas", is_flag=True, default=False, help="Parse the formula of every generated row.")
+@click.option("--pair-index-path", type=click.Path(dir_okay=False, exists=False), default=None,
+              help="Where to persist the digests of the generated rows, to extend the dataset later.")
+@click.option("--extend", is_flag=True, default=False,
+              help="Append the number of samples to the dataset, deduplicating them against the pair index.")
+@click.option("--split-save-path", type=click.Path(file_okay=False, exists=False), default=None,
+              help="Directory where to also write the dataset split in train/val/test files, in OpenNMT format.")
+@click.option("--test-size", type=click.FloatRange(0, 1), default=.33, help="Expected fraction of the pairs in the test split.")
+@click.option("--val-size", type=click.FloatRange(0, 1), default=None,
+              help="Expected fraction of the remaining pairs in the validation split, which is omitted if not provided.")
+@click.option("--split-csv", is_flag=True, default=False, help="Also write the splits as CSV files.")
+@click.option("--tokenized-save-path", type=click.Path(file_okay=False, exists=False), default=None,
+              help="Directory where to also write the token ids of the phrases and formulas, as .npy arrays, with their vocabularies.")
+@click.option("--batch-rendering", is_flag=True, default=False,
+              help="Render the pairs in batches, drawing their random choices with NumPy.")
+@click.option("--dry-run", is_flag=True, default=False,
+              help="Only report the capacity of the identifiers and the projected time and size of the dataset.")
+@click.option("--profile", is_flag=True, default=False,
+              help="Report the wall time, CPU time, peak memory and RSS growth of each stage of the generation.")
+@click.option("--profile-save-path", type=click.Path(dir_okay=False, exists=False), default=None,
+              help="Where to also save the profile of the stages, in JSON.")
+@click.option("--profile-stacks-path", type=click.Path(dir_okay=False, exists=False), default=None,
+              help="Where to save the sampled stacks of the run, in the collapsed format of flamegraph tools.")
+@click.option("--metrics-scope", "-m", multiple=True, default=(PIPELINE_SCOPE,),
+              type=click.Choice([PIPELINE_SCOPE, SAMPLING_SCOPE, RENDERING_SCOPE]), help="Scopes of the timing metrics to record.")
+@click.option("--metrics-save-path", type=click.Path(file_okay=True, exists=False), default=None,
+              help="Where to export the timing metrics, in Prometheus text format if the extension is .prom, else JSON.")
 def main(
         dataset_type: str,
         number_of_samples: int = 10000,
         dataset_save_path: Path = Path("./results/dataset.csv"),
         identifiers_file_path: Path = None,
+        identifiers_sample_size: int = None,
+        patterns_file_path: Path = None,
         seed: int = None,
+        stream: bool = False,
+        output_format: str = "csv",
+        compression: str = None,
+        shard_rows: int = None,
+        writer_threads: int = 1,
+        chunk_size: int = DEFAULT_SHARD_SIZE,
+        workers: int = 1,
+        checkpoint_path: Path = None,
+        resume: bool = False,
+        deduplicate: bool = False,
+        dedup_memory_limit: int = DEFAULT_MEMORY_LIMIT // 2 ** 20,
+        dedup_by: str = "row",
+        validate_formulas: bool = False,
+        pair_index_path: Path = None,
+        extend: bool = False,
+        split_save_path: Path = None,
+        test_size: float = .33,
+        val_size: float = None,
+        split_csv: bool = False,
+        tokenized_save_path: Path = None,
+        batch_rendering: bool = False,
+        dry_run: bool = False,
+        profile: bool = False,
+        profile_save_path: Path = None,
+        profile_stacks_path: Path = None,
+        metrics_scope: Tuple[str] = (PIPELINE_SCOPE,),
+        metrics_save_path: Path = None,
 ):
-    if seed is not None:
-        random.seed(seed)
+    if resume and checkpoint_path is None:
+        raise click.UsageError("--resume requires --checkpoint-path.")
+
+    if extend and pair_index_path is None:
+        raise click.UsageError("--extend requires --pair-index-path.")
+
+    if extend and (output_format != "csv" or compression is not None or shard_rows is not None or tokenized_save_path is not None):
+        raise click.UsageError("--extend only appends to an uncompressed, single CSV file.")
+
+    registry.disable(*registry.scopes)
+    registry.enable(*metrics_scope)
+
+    profile = profile or profile_save_path is not None or profile_stacks_path is not None
+    if profile:
+        profiler.start(sample_stacks=profile_stacks_path is not None)
+
+    pair_index = None
+    if pair_index_path is not None:
+        pair_index = PairIndex(Path(pair_index_path), dedup_by)
+
+    # an extension keeps the seed and the split sizes of the dataset, so that its formulas go to the same splits
+    if extend:
+        pair_index.load()
+        if seed is not None and pair_index.seed is not None and seed != pair_index.seed:
+            raise click.UsageError(f"The dataset was generated with seed {pair_index.seed}, not {seed}.")
+        seed = seed if seed is not None else pair_index.seed
+        if seed is None and split_save_path is not None:
+            raise click.UsageError("The pair index does not record the seed of the dataset, --extend requires --seed.")
+        if split_save_path is not None and pair_index.split_sizes not in (None, (test_size, val_size)):
+            raise click.UsageError(
+                f"The dataset was split with --test-size {pair_index.split_sizes[0]} and --val-size "
+                f"{pair_index.split_sizes[1]}, the extension must be split with the same sizes."
+            )
+
+    if seed is None and resume and (manifest := read_manifest(Path(checkpoint_path))) is not None:
+        seed = manifest["config"]["seed"]
+
+    if seed is None:
+        seed = random.SystemRandom().randrange(2 ** 32)
+        print(f"Using seed {seed}")
 
     dataset_save_path: Path = Path(dataset_save_path)
     print(dataset_save_path.resolve())
 
+    if extend and not dataset_save_path.exists():
+        raise click.UsageError(f"Cannot extend {dataset_save_path.resolve()}, it does not exist.")
+
     identifiers_file_path = Path(identifiers_file_path) if identifiers_file_path is not None else None
-    print(identifiers_file_path.resolve())
+    if identifiers_file_path is not None:
+        print(identifiers_file_path.resolve())
 
     if dataset_type.upper() not in DatasetType.names():
         raise InvalidDatasetType(dataset_type)
 
     dataset_type = DatasetType[dataset_type.upper()]
 
-    dataset_distribution = initialize_application(number_of_samples)
+    with profiler.stage(SETUP_STAGE):
+        pattern_declarations = None
+        if patterns_file_path is not None:
+            pattern_declarations = load_pattern_declarations(Path(patterns_file_path))
+
+        dataset_distribution = initialize_application(number_of_samples, pattern_declarations)
+
+    with profiler.stage(IDENTIFIERS_STAGE):
+        generation_strategy = generation_strategy_factory(
+            dataset_type, dataset_distribution, identifiers_file_path, batch_rendering, identifiers_sample_size,
+            random.Random(seed)
+        )
+
+    if dry_run:
+        print(plan_dataset(generation_strategy, seed, workers))
+        return
+
+    if pair_index is not None:
+        pair_index.seed = seed
+        if split_save_path is not None:
+            pair_index.split_sizes = test_size, val_size
+
+    # the extension is drawn from its own random streams, the splits keep assigning the formulas with the seed
+    generation_seed = seed
+    if extend:
+        generation_seed = derive_seed(seed, len(pair_index))
+        print(f"Extending {dataset_save_path.resolve()}, whose pair index has {len(pair_index)} rows")
+
+    dataset_generator = ShardedDatasetGenerator(
+        dataset_distribution, dataset_type, generation_strategy, generation_seed, workers, chunk_size
+    )
+
+    checkpointed_dataset_generator = None
+    if checkpoint_path is not None:
+        dataset_generator = checkpointed_dataset_generator = CheckpointedDatasetGenerator(
+            dataset_generator, Path(checkpoint_path), resume
+        )
 
-    generation_strategy = generation_strategy_factory(dataset_type, dataset_distribution, identifiers_file_path)
+    deduplicated_dataset_generator = None
+    if deduplicate or extend:
+        dataset_generator = deduplicated_dataset_generator = DeduplicatedDatasetGenerator(
+            dataset_generator, dedup_memory_limit * 2 ** 20, key=dedup_keys[dedup_by],
+            seen_digests=pair_index.digests if extend else ()
+        )
 
-    dataset_generator = DatasetGenerator(dataset_distribution, dataset_type, generation_strategy)
+    # also validates the rows replacing the duplicates
+    if validate_formulas:
+        dataset_generator = ValidatedDatasetGenerator(dataset_generator)
 
-    dataset = dataset_generator.generate_dataset()
+    dataset_writer = None
+    if output_format != "csv" or compression is not None or shard_rows is not None:
+        dataset_writer = DatasetWriter(dataset_save_path, output_format, compression, shard_rows, writer_threads)
 
-    save_csv(dataset, dataset_save_path)
+    with contextlib.ExitStack() as stack:
+        stack.enter_context(profiler.stage(EXPORT_STAGE))
+
+        dataset_splitter = None
+        if split_save_path is not None:
+            dataset_splitter = stack.enter_context(DatasetSplitter(
+                Path(split_save_path), test_size, val_size, seed, split_csv, append=extend
+            ))
+
+        tokenized_dataset_writer = None
+        if tokenized_save_path is not None:
+            from nl2ltl_dataset_generator.base.tokenized import TokenizedDatasetWriter
+            tokenized_dataset_writer = stack.enter_context(TokenizedDatasetWriter(Path(tokenized_save_path)))
+
+        if stream or dataset_writer is not None or extend:
+            chunks = profiler.profile_chunks(dataset_generator.generate_chunks(), POSTPROCESSING_STAGE)
+            chunks = dataset_splitter.tee(chunks) if dataset_splitter is not None else chunks
+            chunks = tokenized_dataset_writer.tee(chunks) if tokenized_dataset_writer is not None else chunks
+            chunks = pair_index.tee(chunks) if pair_index is not None else chunks
+
+            if dataset_writer is not None:
+                dataset_writer.write(chunks)
+            else:
+                save_csv_stream(chunks, dataset_save_path, append=extend)
+        else:
+            with profiler.stage(POSTPROCESSING_STAGE):
+                dataset = dataset_generator.generate_dataset()
+
+            save_csv(dataset, dataset_save_path)
+
+            if dataset_splitter is not None:
+                dataset_splitter.write(dataset.pairs)
+
+            if tokenized_dataset_writer is not None:
+                tokenized_dataset_writer.write(dataset.pairs)
+
+            if pair_index is not None:
+                pair_index.add(dataset.pairs)
+
+    if pair_index is not None:
+        with profiler.stage(EXPORT_STAGE):
+            pair_index.save()
+
+    if dataset_splitter is not None:
+        print(f"Dataset split in {Path(split_save_path).resolve()}: {dataset_splitter.counts}")
+
+    if tokenized_save_path is not None:
+        print(f"Dataset tokenized in {Path(tokenized_save_path).resolve()}: {tokenized_dataset_writer.n_pairs} pairs, "
+              f"{len(tokenized_dataset_writer.vocabularies['src'])} source and "
+              f"{len(tokenized_dataset_writer.vocabularies['tgt'])} target tokens")
+
+    if deduplicated_dataset_generator is not None:
+        print(deduplicated_dataset_generator.get_report())
+
+    if batch_rendering and workers <= 1:
+        from nl2ltl_dataset_generator.base.batch import rendering_stats
+        print(f"Batch rendering: {rendering_stats.pairs_per_second:.0f} pairs/s")
 
     print(get_means())
 
-    print(f"Dataset generated in {dataset_save_path.resolve()}")
+    if profile:
+        profiler.stop()
+        print(profiler.get_report())
+        if profile_save_path is not None:
+            profiler.save(Path(profile_save_path))
+        if profile_stacks_path is not None:
+            profiler.save_stacks(Path(profile_stacks_path))
+
+    if metrics_save_path is not None:
+        metrics_save_path = Path(metrics_save_path)
+        metrics_save_path.write_text(registry.to_prometheus() if metrics_save_path.suffix == ".prom" else registry.to_json())
+
+    output_files = dataset_writer.file_paths if dataset_writer is not None else [dataset_save_path]
+    if checkpointed_dataset_generator is not None:
+        checkpointed_dataset_generator.finish(output_files)
+
+    if dataset_writer is not None:
+        print(f"Dataset generated in {', '.join(str(file_path.resolve()) for file_path in dataset_writer.file_paths)}")
+    else:
+        print(f"Dataset generated in {dataset_save_path.resolve()}")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,268 @@
+import csv
+import dataclasses
+import io
+import json
+import random
+import threading
+import urllib.request
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Tuple, Generator, Any
+
+import click
+
+from nl2ltl_dataset_generator.base import *
+from nl2ltl_dataset_generator.base.data_model import Identifier, Pair
+from nl2ltl_dataset_generator.base.exceptions import InvalidGenerationRequest
+from nl2ltl_dataset_generator.base.core import RestrictedPairGenerationStrategy, UnrestrictedPairGenerationStrategy
+from nl2ltl_dataset_generator.base.loader import CSV_COLUMNS, pair_to_row, load_unrestricted_identifiers
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+@dataclasses.dataclass
+class GenerationRequest:
+    """The options of a dataset, named after the ones of main."""
+    dataset_type: str
+    number_of_samples: int = 10000
+    seed: int = None
+    identifiers_file_path: str = None
+    identifiers_sample_size: int = None
+    patterns_file_path: str = None
+    # weight of each pattern, replacing the declared one, e.g. {"response_global": 10}
+    weights: Dict[str, int] = None
+    chunk_size: int = DEFAULT_SHARD_SIZE
+    deduplicate: bool = False
+    batch_rendering: bool = False
+
+    def __post_init__(self):
+        # the bounds of the options of main
+        for name, minimum, optional in (("number_of_samples", 1, False), ("chunk_size", 1, False),
+                                        ("seed", 0, True), ("identifiers_sample_size", 1, True)):
+            value = getattr(self, name)
+            if value is None and optional:
+                continue
+            if not _is_int(value) or value < minimum:
+                raise InvalidGenerationRequest(f"{name} must be an integer of at least {minimum}, not {value!r}")
+
+        if self.weights is not None:
+            if not isinstance(self.weights, dict):
+                raise InvalidGenerationRequest(f"weights must map pattern names to weights, not {self.weights!r}")
+            for name, weight in self.weights.items():
+                if not _is_int(weight) or weight < 0:
+                    raise InvalidGenerationRequest(f"weights['{name}'] must be a non negative integer, not {weight!r}")
+
+    @classmethod
+    def from_json(cls, body: bytes) -> 'GenerationRequest':
+        try:
+            return cls(**json.loads(body))
+        except (ValueError, TypeError) as error:
+            raise InvalidGenerationRequest(str(error)) from None
+
+
+def _is_int(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _file_key(file_path: str) -> Tuple[str, int]:
+    """A file path with its modification time, so that an edited file is loaded again."""
+    path = Path(file_path).resolve()
+    if not path.exists():
+        raise Exception(f"{path} does not exists!")
+    return str(path), path.stat().st_mtime_ns
+
+
+class GenerationState:
+    """What main loads at every run, kept in memory across the requests.
+
+    Identifiers files are parsed once, and the pattern declarations once registered (compiling their templates), for as
+    long as the files are not modified. Each request then only builds its own DatasetDistribution.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._identifiers: Dict[tuple, List[Identifier]] = {}
+        self._pair_types: Dict[tuple, List[PairType]] = {}
+        self.n_requests = 0
+
+    def __getstate__(self) -> dict:
+        # the loaded files are copied, e.g. to the workers of a batch, each with its own lock
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get_identifiers(self, request: GenerationRequest) -> List[Identifier]:
+        key = (*_file_key(request.identifiers_file_path), request.identifiers_sample_size,
+               request.seed if request.identifiers_sample_size is not None else None)
+
+        with self._lock:
+            if key not in self._identifiers:
+                self._identifiers[key] = load_unrestricted_identifiers(
+                    Path(request.identifiers_file_path), request.identifiers_sample_size, random.Random(request.seed)
+                )
+            return self._identifiers[key]
+
+    def get_pair_types(self, request: GenerationRequest) -> List[PairType]:
+        """New PairTypes, with their own distribution, sharing the registered templates."""
+        key = _file_key(request.patterns_file_path) if request.patterns_file_path is not None else None
+
+        with self._lock:
+            if key not in self._pair_types:
+                declarations = load_pattern_declarations(Path(request.patterns_file_path)) if key is not None \
+                    else default_pattern_declarations
+                self._pair_types[key] = build_pair_types(declarations)
+            pair_types = self._pair_types[key]
+
+        weights = request.weights or {}
+        if unknown := set(weights) - {str(pair_type) for pair_type in pair_types}:
+            raise InvalidGenerationRequest(f"unknown patterns {', '.join(sorted(unknown))}")
+
+        pair_types = [
+            dataclasses.replace(pair_type, distribution=PairTypeDistribution(
+                weights.get(str(pair_type), pair_type.distribution.old_value)
+            ))
+            for pair_type in pair_types
+        ]
+        if not any(pair_type.distribution.old_value > 0 for pair_type in pair_types):
+            raise InvalidGenerationRequest("weights must not all be zero")
+
+        return pair_types
+
+    def get_dataset_generator(self, request: GenerationRequest):
+        """The generator of the dataset that main writes for the same options."""
+        if request.dataset_type.upper() not in DatasetType.names():
+            raise InvalidDatasetType(request.dataset_type)
+        dataset_type = DatasetType[request.dataset_type.upper()]
+
+        dataset_distribution = DatasetDistribution(request.number_of_samples, self.get_pair_types(request))
+        dataset_distribution.update_info()
+
+        if dataset_type is DatasetType.RESTRICTED:
+            generation_strategy = RestrictedPairGenerationStrategy(dataset_distribution)
+        else:
+            if request.identifiers_file_path is None:
+                raise InvalidGenerationRequest("unrestricted datasets need an identifiers_file_path")
+            generation_strategy = UnrestrictedPairGenerationStrategy(dataset_distribution, self.get_identifiers(request))
+        generation_strategy.batch_rendering = request.batch_rendering
+
+        dataset_generator = ShardedDatasetGenerator(
+            dataset_distribution, dataset_type, generation_strategy, request.seed, shard_size=request.chunk_size
+        )
+        if request.deduplicate:
+            dataset_generator = DeduplicatedDatasetGenerator(dataset_generator)
+
+        with self._lock:
+            self.n_requests += 1
+
+        return dataset_generator
+
+    def get_status(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.n_requests,
+                "identifiers_files": [{"file_path": key[0], "identifiers": len(identifiers)}
+                                      for key, identifiers in self._identifiers.items()],
+                "patterns_files": [key[0] if key is not None else None for key in self._pair_types],
+            }
+
+
+def _encode_rows(pairs: List[Pair], header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    writer.writerows(pair_to_row(pair) for pair in pairs)
+    return buffer.getvalue().encode()
+
+
+class GenerationRequestHandler(BaseHTTPRequestHandler):
+    """POST /generate streams the CSV rows of the requested dataset, one HTTP chunk per generated chunk.
+
+    GET /status reports the requests served and the state kept in memory.
+    """
+    protocol_version = "HTTP/1.1"
+    server: 'GenerationServer'
+
+    def _send(self, status: HTTPStatus, body: dict) -> None:
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+
+    def do_GET(self):
+        if self.path != "/status":
+            self._send(HTTPStatus.NOT_FOUND, {"error": f"{self.path} not found"})
+            return
+        self._send(HTTPStatus.OK, self.server.state.get_status())
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self._send(HTTPStatus.NOT_FOUND, {"error": f"{self.path} not found"})
+            return
+
+        # errors in the request, and in the first chunk, are reported before any row is sent
+        try:
+            request = GenerationRequest.from_json(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            if request.seed is None:
+                request.seed = random.SystemRandom().randrange(2 ** 32)
+            chunks = self.server.state.get_dataset_generator(request).generate_chunks()
+            first_chunk = next(chunks, [])
+        except Exception as error:
+            self._send(HTTPStatus.BAD_REQUEST, {"error": str(error)})
+            return
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/csv")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("X-Seed", str(request.seed))
+        self.end_headers()
+
+        # a later error truncates the response, which then misses its last chunk
+        self._write_chunk(_encode_rows(first_chunk, header=True))
+        for chunk in chunks:
+            self._write_chunk(_encode_rows(chunk))
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class GenerationServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int] = (DEFAULT_HOST, DEFAULT_PORT)):
+        super(GenerationServer, self).__init__(address, GenerationRequestHandler)
+        self.state = GenerationState()
+
+
+def request_dataset(url: str, **options) -> Generator[List[str], Any, None]:
+    """Lazily read the rows, header included, of the dataset generated by the server at url with the options of
+    GenerationRequest, e.g. request_dataset("http://127.0.0.1:8765", dataset_type="restricted", seed=5)."""
+    http_request = urllib.request.Request(
+        f"{url.rstrip('/')}/generate", json.dumps(options).encode(), {"Content-Type": "application/json"}
+    )
+
+    with urllib.request.urlopen(http_request) as response:
+        yield from csv.reader(io.TextIOWrapper(response, newline=''))
+
+
+@click.command()
+@click.option("--host", default=DEFAULT_HOST, help="Address to listen on, only the local host by default.")
+@click.option("--port", type=click.IntRange(0, 65535), default=DEFAULT_PORT)
+def serve(host: str, port: int):
+    registry.disable(*registry.scopes)
+
+    with GenerationServer((host, port)) as server:
+        print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]}")
+        server.serve_forever()
+
+
+if __name__ == '__main__':
+    serve()